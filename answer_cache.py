@@ -0,0 +1,138 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from context_window import EMAIL_RE, PHONE_RE
+
+ANSWER_CACHE_PATH = os.getenv("NITTI_ANSWER_CACHE_PATH", "answer_cache.db")
+ANSWER_CACHE_TTL = float(os.getenv("NITTI_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("NITTI_ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# Words that carry no meaning for matching ("hi, can you tell me the warranty please?")
+FILLER_WORDS = {
+    "hi", "hello", "hey", "please", "pls", "can", "could", "would", "you", "tell", "me",
+    "i", "want", "to", "know", "the", "a", "an", "kindly", "just", "do", "nitti",
+}
+# Questions that lean on earlier turns or are personal are never served from the cache
+CONTEXT_WORDS = {
+    "it", "its", "that", "this", "these", "those", "they", "them", "one", "ones",
+    "yes", "no", "ok", "okay", "sure", "thanks", "thank", "above", "previous",
+    "store", "stores", "nearest", "location", "buy", "address", "my",
+}
+WORD_RE = re.compile(r"[a-z0-9]+")
+PERSONAL_RE = re.compile(r"@|\d{6,}")
+
+
+def normalize_question(question):
+    words = WORD_RE.findall(question.lower())
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def is_cacheable(question):
+    """Only standalone, non-personal questions (FAQ style) are cached."""
+    if len(question) > 200 or PERSONAL_RE.search(question):
+        return False
+    normalized = normalize_question(question)
+    return bool(normalized) and not CONTEXT_WORDS.intersection(normalized.split())
+
+
+def is_shareable(answer, private=()):
+    """Answers holding an email address, a phone number or any of the `private` values are never shared."""
+    if EMAIL_RE.search(answer) or PHONE_RE.search(answer):
+        return False
+    return not any(value and value in answer for value in private)
+
+
+class AnswerCache:
+    """
+    SQLite-backed cache of generated answers shared by every worker process.
+    Entries expire after `ttl` seconds; beyond `max_entries` the least recently
+    used ones are evicted.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT, answer TEXT, "
+                "created REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(question, version):
+        return hashlib.sha256(f"{version}\0{normalize_question(question)}".encode()).hexdigest()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, question, version):
+        key = self.key(question, version)
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._count(False)
+            return None
+        with conn:
+            conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self._count(True)
+        return row[0]
+
+    def put(self, question, version, answer, private=()):
+        """Stores an answer unless it is not shareable (see is_shareable); returns whether it was stored."""
+        if not answer or not is_shareable(answer, private):
+            return False
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, answer, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (self.key(question, version), question, answer, now, now),
+            )
+            conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return True
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
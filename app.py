@@ -4,129 +4,150 @@ import streamlit as st
 import re
 from dotenv import load_dotenv, find_dotenv
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 import base64
+import functools
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Load environment variables. The local modules below read their settings (OPENAI_BASE_URL,
+# timeouts, pool sizes, NITTI_*) from the environment when first imported, so .env goes first
+_ = load_dotenv(find_dotenv())
 
 # IMPORT the CSV-logging function from log_backend
 from log_backend import save_user_data
+from geocoder import geocode_postal, is_valid_postal
+from store_registry import COUNTRY_CODES, StoreRegistry
+from llm_client import build_client, create_chat_completion
+from llm_gateway import LLMGateway
+from model_router import ModelRouter
+from context_window import fit_messages, new_window_state, remember_contacts
+from catalog import CATALOG_VERSION, catalog_overview, retrieve_context
+from answer_cache import AnswerCache, is_cacheable
+from store_tools import MAX_TOOL_ROUNDS, STORE_TOOLS, run_store_tool, tool_call_messages
+from intent_router import IntentRouter
+from transcript_store import log_turn
+from chat_view import bubble_html, new_view_state, render_chat_history
+from session_store import build_store, strip_private
+from metrics import PHASE_SECONDS, REGISTRY, REPLIES, TOKENS, start_server
 
-# Load environment variables
-_ = load_dotenv(find_dotenv())
+logger = logging.getLogger(__name__)
 
 # OpenAI API Key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# temporary for debugging purpose
-print("OPENAI_API_KEY:", os.environ.get("OPENAI_API_KEY"))
+# Rerun timing ends at the bottom of the script
+RERUN_STARTED = time.perf_counter()
+
+@st.cache_resource
+def start_metrics_server():
+    """Prometheus /metrics and /metrics.json on NITTI_METRICS_PORT, once per process."""
+    return start_server()
+
+start_metrics_server()
+
+# Initialize geocoder (only used as a fallback when the bundled postal tables miss)
+# NOMINATIM_DOMAIN / NOMINATIM_SCHEME point it elsewhere, e.g. at bench/fake_nominatim.py
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
+
+@st.cache_resource
+def get_geolocator():
+    return Nominatim(user_agent="nitti_bot", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
 
-# Initialize geocoder
-geolocator = Nominatim(user_agent="nitti_bot")
+geolocator = get_geolocator()
+NOMINATIM_FALLBACK = os.getenv("NOMINATIM_FALLBACK", "1") != "0"
+
+# ===========================
+# Static assets: Streamlit reruns this script on every interaction, so files are read
+# and encoded once per process and only re-read when their modification time changes
+# ===========================
+STYLE_PATH = "static/style.css"
+ICON_PATH = "icon.png"
+
+def file_mtime(path):
+    return os.stat(path).st_mtime_ns
+
+@st.cache_resource(max_entries=4)
+def load_css(path, mtime):
+    with open(path, encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
 # ===========================
 # CUSTOM UI: Inject custom CSS for styling using Nitti colors (bright yellow, white, and black)
 # ===========================
-st.markdown(
-    """
-    <style>
-    /* Global Page Background */
-    .reportview-container, .main {
-        background-color: #ffffff;
-    }
-    /* Header styling */
-    .header {
-        background-color: #FFD700; /* Bright yellow */
-        padding: 10px;
-        border-radius: 10px;
-        text-align: center;
-        margin-bottom: 20px;
-    }
-    .header img {
-        width: 50px;
-        height: 50px;
-        vertical-align: middle;
-    }
-    .header h1 {
-        display: inline;
-        margin-left: 10px;
-        vertical-align: middle;
-        color: #000000; /* Black text */
-        font-family: sans-serif;
-    }
-    /* Chat container styling */
-    .chat-container {
-        max-width: 800px;
-        margin: auto;
-        padding: 10px;
-    }
-    /* User message bubble styling */
-    .user-message {
-        background-color: #000000; /* black */
-        color: #ffffff;
-        padding: 10px;
-        border-radius: 21px;
-        margin: 10px 0;
-        text-align: right;
-        max-width: 70%;
-        float: right;
-        clear: both;
-        font-family: sans-serif;
-    }
-    /* Bot message bubble styling */
-    .bot-message {
-        background-color: #FFD700; /* bright yellow */
-        color: #000000;
-        padding: 10px;
-        border-radius: 21px;
-        margin: 10px 0;
-        text-align: left;
-        max-width: 70%;
-        float: left;
-        clear: both;
-        font-family: sans-serif;
-    }
-    /* Input box styling: override Streamlit's default input style */
-    input, textarea {
-        border-radius: 21px !important;
-        border: 2px solid #000000 !important;
-        padding: 10px !important;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+ASSETS_STARTED = time.perf_counter()
+st.markdown(load_css(STYLE_PATH, file_mtime(STYLE_PATH)), unsafe_allow_html=True)
 
 # ===========================
 # CUSTOM UI: Header with a yellow box around the customer service icon and title
 # ===========================
-def get_base64(file_path):
+@st.cache_resource(max_entries=4)
+def get_base64(file_path, mtime):
     with open(file_path, "rb") as f:
         data = f.read()
     return base64.b64encode(data).decode()
 
-icon_base64 = get_base64("icon.png")
-
-st.markdown(
-    f"""
+@st.cache_resource(max_entries=4)
+def header_html(icon_path, mtime):
+    return f"""
     <div style="background-color: #FFD700; padding: 10px; border-radius: 10px; text-align: center;">
-        <img src="data:image/png;base64,{icon_base64}" width="100" style="vertical-align: middle;" alt="Customer Service Icon">
+        <img src="data:image/png;base64,{get_base64(icon_path, mtime)}" width="100" style="vertical-align: middle;" alt="Customer Service Icon">
         <h1 style="display: inline; color: #ffffff; font-family: sans-serif; margin-left: 10px;">
             Protection, Comfort, Durability, Everyday
         </h1>
     </div>
-    """,
-    unsafe_allow_html=True
-)
+    """
+
+st.markdown(header_html(ICON_PATH, file_mtime(ICON_PATH)), unsafe_allow_html=True)
+PHASE_SECONDS.observe(time.perf_counter() - ASSETS_STARTED, phase="assets")
+
+# ===========================
+# Session restore: the session id travels in the URL (?sid=...), so a reload, a
+# reconnect or another dyno sharing the session backend picks the conversation up.
+# Anyone given the link can do the same, so what identifies the customer (pinned
+# contact details, the nearest store, emails and phone numbers) is not restored.
+# ===========================
+SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+@st.cache_resource
+def get_session_store():
+    """NITTI_SESSION_BACKEND: "memory" (default), "sqlite" or "none"."""
+    return build_store()
+
+def persist_session():
+    store = get_session_store()
+    if store is not None:
+        with PHASE_SECONDS.time(phase="session_save"):
+            store.save(st.session_state.session_id, st.session_state)
+
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("sid", "")
+    if not SESSION_ID_RE.fullmatch(session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["sid"] = session_id
+    st.session_state.session_id = session_id  # also groups this session's turns in the transcripts
+    saved = get_session_store().load(session_id) if get_session_store() is not None else None
+    if saved:
+        st.session_state.update(strip_private(saved))
 
 # ===========================
 # Original Session State Initialization
 # ===========================
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "context_window" not in st.session_state:
+    st.session_state.context_window = new_window_state()  # rolling summary of older turns
+if "chat_view" not in st.session_state:
+    st.session_state.chat_view = new_view_state()  # rendered bubbles and the visible window
 if "chat_enabled" not in st.session_state:
     st.session_state.chat_enabled = False  # Set to True to allow input field to appear
-if "chat_context" not in st.session_state:
-    st.session_state.chat_context = [
-        {'role': 'system', 'content': """
+@st.cache_resource
+def get_system_prompt():
+    """The system prompt and its version string, built once per process."""
+    prompt = f"""
 You are Nitti, a Customer service AI Chatbot for Nitti Safety Footwear, an automated service to assist incoming enquiries.
 You first greet the customer, then assist with the enquiry regarding safety shoes,
 and then ask if our sales can reach out to them.
@@ -144,69 +165,28 @@ Ensure clarity on product models, accessories, and customer details.
 You respond in a short, friendly, and conversational style, without repeating questions more than twice.
 Orders cannot be placed via this chatbot; instead, collect the user's contact details for a sales follow-up.
 If customers ask where to buy their shoes or any related question to purchasing give them the nearest store and the distance to this store in kilometres. 
-The list includes:
-Low cut models:
-- 21281, black, Rating: CE EN 20345:2011 S1P SRC, Model: Lace, Size: 2-14 (UK) / 35-48 (EU), Upper: Leather, Lining: Genuine Cambrelle®, 
-  Outsole: Direct Injection Polyurethane, Suitable for Manufacturing & light industrial
-- 21381, Rating: CE EN 20345:2011 S1P SRC, Type: Low Cut, Model: Velcro & Ventilated, Size: 2-14 (UK) or 35-48 (EU), Color: Black or Brown, Upper: Leather,
-  Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for Manufacturing & light industrial
-- 21981 black, Rating: CE EN 20345:2011 S1P SRC, Type: Low Cut, Model: Slip-on, Size: 2-14 (UK) or 35-48 (EU), Color: Black, Upper: Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for Hospitality & kitchens
-Mid cut models:
-22281, Color: Black, Rating: CE EN 20345:2011 S1P SRC, Type: Mid Cut, Model: lace, Size: 2-14 (UK) / 35-48 (EU), Upper: Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for: Light & heavy industrial
-22681, Color: Black, Rating: CE EN 20345:2011 S3 SRC, Type: Mid Cut, Model: Zipper, Size: 2-14 (UK) / 35-48 (EU), Upper: Water Resistant Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for: Various industrial environments
-22781, Color: Black and Brown, Rating: CE EN 20345:2011 S3 SRC (Black) | CE EN 20345:2011 S3 SRC* (Brown), Type: Mid Cut, Model: Slip-on / Pull-on, Size: 2-14 (UK) / 35-48 (EU), Upper: Water Resistant Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for: Petrochemical, oil & gas, marine
-High cut models:
-- 23281 black and brown, CE EN 20345:2011 S3 SRC, Type: High Cut, Model: Pull-on, Size: 2-14 (UK) or 35-48 (EU), Upper: Water Resistant Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for Petrochemical, oil & gas, marine
-- 23681 black and brown, CE EN 20345:2011 S3 SRC, Type: High Cut, Model: zipper, Size: 2-14 (UK) or 35-48 (EU), Upper: Water Resistant Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for Petrochemical, oil & gas, marine
-- 23381 black and brown, CE EN 20345:2011 S3 SRC, Type: High Cut, Model: lace, Size: 2-14 (UK) or 35-48 (EU), Upper: Water Resistant Leather, Lining: Cambrelle®, Outsole: Direct Injection Polyurethane, Suitable for Mining, plantations, oil & gas
-if customers ask for lowcut, midcut or highcut models give them all models including their decription in a list like described here. 
+Use the find_nearest_store tool with their postal code, or the search_stores tool with an area or store name, to look up stores.
+{catalog_overview()}
+If customers ask for lowcut, midcut or highcut models give them all models including their description in a list.
 Then ask which models they would like to know more about.
-Accessories:
-- Socks
-- Shoe Guard
-- T-shirt
-- Mouse pad
-Information about the models you use during the conversation:
-- Models to be used in wet and waterproof environments are the mid and high cut models, not the low cut.
-- 21281: This model is designed to provide you with extra comfort during those long working hours.
-- 21981: A general purpose and well ventilated model with an industrial grade Velcro strap for added functionality.
-  Improved ventilation to maintain comfort for workers in hot environments.
-Safety ratings:
-- Indonesia Rating: SNI 7079-2009
-- Singapore Rating: SS 513
-- China Rating: GB 21148
-- Malaysia Rating: Sirim
-- Other: As/NZS 2210.3.2019 and OSHC
-Information about direct injection to use:
-Direct injection is the process where the PU is directly injected into the mold as opposed to glued to the upper of the shoe. 
-This ensures a better bond and is of higher quality than non-direct injection.
-Warranty information:
-Nitti Safety Footwear is warranted for six (6) months from the date of invoice by Nitti to its distributors
-against defects in materials and/or workmanship when used under normal conditions for its intended purpose.
-Return policy:
-As a requirement of the warranty mentioned above, the purchaser must return the footwear to Nitti for assessment together with proof of purchase or receipt.
-Following assessment, if Nitti determines that the footwear is defective as the result of normal use, Nitti will replace the footwear.
-Warranty information:
-Nitti Safety Footwear is warranted for six (6) months from the date of invoice by Nitti to its distributors against defects in materials and/or workmanship when used under normal conditions for its intended purpose.
-If your shoes are defective, return them with proof of purchase to Nitti or an Authorized distributor for assessment.
-Following the assessment, if Nitti determines that the footwear is defective as the result of normal use, Nitti will replace the footwear (excluding shipping cost, import duties, and taxes).
-you can use this as extra information about warranty: 
-We offer replacements, not refunds. 
-The warranty is valid internationally under the stated conditions.
-If you have lost your receipt, the manufacturing date at the bottom of the sole will be decisive. 
-If one side is damaged then both shoes will be replaced.
-Boot care:
-1. Do not store your boots in direct sunlight. Always air-dry your boots after use and store them in a cool, dry, and well-ventilated place.
-2. Clean and polish your boots regularly with wax to enhance durability. Be sure to rinse your boots with water after contact with cement. 
-   Left unattended, cement will damage the leather upper, drying it out and causing cracks to form.
-3. Do not wash your boots. Wet boots should be air-dried naturally at room temperature with the cushion footbed and laces removed and the boots fully opened. 
-   Never force dry or use strong detergents or caustic cleaning agents.
-
-The Founding of Nitti
-Nitti was born in 1998 following a preventable accident at the Nitti factory—an incident caused by inferior safety footwear. At a time when other brands dominated the market, Nitti emerged as a true underdog. Determined to prevent such tragedies and inspired by the need for better protection, a team of dedicated industry professionals set out to create safety footwear that combined uncompromising quality with exceptional comfort.
-Fuelled by tenacity and a commitment to customer service, they invested countless hours into research, design, and rigorous testing. Their breakthrough products not only prevented further accidents but also redefined industry standards. Over time, Nitti's unwavering focus on quality, innovation, and responsive support allowed them to gradually gain trust and grow into the market leader they are today.
-This story of resilience and commitment continues to inspire Nitti's mission—ensuring that every pair of safety shoes not only meets the highest standards but also truly protects those who wear them.
-"""} ]
+Product specifications, accessories, safety ratings, warranty, return policy, boot care and the story of Nitti
+are provided in a separate system message with each question. Only use that information for product details.
+"""
+    # Identifies the prompt + catalog that produced a cached answer
+    return prompt, hashlib.sha1(f"{prompt}{CATALOG_VERSION}".encode()).hexdigest()[:12]
+
+SYSTEM_PROMPT, PROMPT_VERSION = get_system_prompt()
+
+@st.cache_resource
+def get_system_message():
+    """The system prompt message, one object shared by reference by every session."""
+    return {'role': 'system', 'content': SYSTEM_PROMPT}
+
+SYSTEM_MESSAGE = get_system_message()
+
+# Per-session system messages only (e.g. the nearest store); SYSTEM_MESSAGE is prepended per request
+if "chat_context" not in st.session_state:
+    st.session_state.chat_context = []
 
 # ✅ Validation functions
 def is_valid_email(email):
@@ -215,227 +195,281 @@ def is_valid_email(email):
 def is_valid_phone(phone):
     return re.match(r"^\+?\d{10,15}$", phone)
 
-def validate_postal(postal_code):
-    return re.match(r'^\d{6}$', postal_code) is not None
+def validate_postal(postal_code, country="Singapore"):
+    return is_valid_postal(COUNTRY_CODES[country], postal_code)
 
-def get_coordinates(postal_code):
+def get_coordinates(postal_code, country="Singapore"):
+    if not validate_postal(postal_code, country):
+        return None
+    with PHASE_SECONDS.time(phase="geocode"):
+        coords = geocode_postal(COUNTRY_CODES[country], postal_code)
+    if coords or not NOMINATIM_FALLBACK:
+        return coords
     try:
-        location = geolocator.geocode(postal_code + ", Singapore")
+        with PHASE_SECONDS.time(phase="geocode_nominatim"):
+            location = geolocator.geocode(f"{postal_code}, {country}")
         return (location.latitude, location.longitude) if location else None
     except Exception as e:
-        st.error(f"Error fetching coordinates: {e}")
+        # Also runs on the worker pool, where st.* is unavailable
+        logger.warning("Error fetching coordinates for %s, %s: %s", postal_code, country, e)
         return None
 
-def find_nearest_store(postal_code):
-    if not validate_postal(postal_code):
+def find_nearest_store(postal_code, country="Singapore"):
+    snapshot = get_store_registry().snapshot()
+    locator = snapshot.locator(country)
+    if locator is None:
+        return snapshot.notice(country)
+    if not validate_postal(postal_code, country):
         return "Invalid postal code format."
-    user_coords = get_coordinates(postal_code)
+    user_coords = get_coordinates(postal_code, country)
     if not user_coords:
         return "Could not find location."
-    nearest_store = min(
-        stores.items(),
-        key=lambda store: geodesic(user_coords, store[1]["coordinates"]).kilometers
-    )
-    store_name, store_data = nearest_store
-    return f"Nearest store: {store_name} ({store_data['address']}, Tel: {store_data['tel']}, Distance: {geodesic(user_coords, store_data['coordinates']).kilometers:.2f} km)"
-
-
-# ✅ Predefined store locations
-stores = {
-    "H K ENGINEERING PTE LTD - 49 Joo Koon Cir": {
-        "coordinates": (1.3273, 103.6730),
-        "address": "49 Joo Koon Cir, Singapore 629068",
-        "tel": "6565 5555"
-    },
-    "KOON HIN LEE SAFETY PRODUCTS - 221 Boon Lay Place, Boon Lay Shopping Centre": {
-        "coordinates": (1.3474, 103.7138),
-        "address": "221 Boon Lay Place #01-238, Boon Lay Shopping Centre, 640221",
-        "tel": "6268 0401"
-    },
-    "TAKA HARDWARE & ENGINEERING PTE LTD - 32 Lok Yang Way": {
-        "coordinates": (1.3216, 103.6851),
-        "address": "32 Lok Yang Way, Singapore 628639",
-        "tel": "6842 0782"
-    },
-    "SINYOU HARDWARE PTE LTD - 5 Soon Lee St, Pioneer Point": {
-        "coordinates": (1.3275, 103.6961),
-        "address": "5 Soon Lee St #01-21, Pioneer Point, Singapore 627607",
-        "tel": "6710 5955"
-    },
-    "MUI HUAT TRADING - 221 Boon Lay Place, Boon Lay Shopping Centre": {
-        "coordinates": (1.3474, 103.7138),
-        "address": "221 Boon Lay Place #01-238, Boon Lay Shopping Centre, Singapore 640221",
-        "tel": "6261 3590"
-    },
-    "NS HARDWARE PTE LTD - 2 Buroh Cres, Ace@Buroh": {
-        "coordinates": (1.3262, 103.6987),
-        "address": "2 Buroh Cres, #01-15, Ace@Buroh, Singapore 627546",
-        "tel": "6029 3113"
-    },
-    "AGGREGATES ENGINEERING PTE LTD - 2B Tuas Ave 12": {
-        "coordinates": (1.3221, 103.6525),
-        "address": "2B Tuas Ave 12, Singapore 639048",
-        "tel": "6741 4638"
-    },
-    "SIN HILL INTERNATIONAL PTE LTD - 11 Woodlands Close": {
-        "coordinates": (1.4289, 103.7954),
-        "address": "11 Woodlands Close #05-32, Singapore 737853",
-        "tel": "6555 1658"
-    },
-    "ISSA LEATHER BAGS AND SHOES SHOP - 4 Woodlands Street 12, Marsiling Mall": {
-        "coordinates": (1.4337, 103.7741),
-        "address": "4 Woodlands Street 12, #02-49, Marsiling Mall, Singapore 738623",
-        "tel": "6269 5178"
-    },
-    "KIAN HUAT ENTERPRISES - 39 Woodlands Cl, Mega@Woodlands": {
-        "coordinates": (1.4305, 103.7852),
-        "address": "39 Woodlands Cl, #01-13, Mega@Woodlands, Singapore 737856",
-        "tel": "6779 9686"
-    },
-    "UNIQUE HARDWARE PTE LTD - 30 Kranji Loop, TimMac@Kranji": {
-        "coordinates": (1.4267, 103.7623),
-        "address": "30 Kranji Loop BlkB, #04-17, TimMac@Kranji, 739570",
-        "tel": "6748 4211"
-    },
-    "JAHO TRADING PTE LTD - 60 Jalan Lam Huat, Carros Centre": {
-        "coordinates": (1.4316, 103.7859),
-        "address": "60 Jalan Lam Huat #01-16, Carros Centre, Singapore 737869",
-        "tel": "6481 7305"
-    },
-    "KIANG SING HONG PTE LTD - 280 Woodlands Industrial Park E5, Harvest Building": {
-        "coordinates": (1.4472, 103.7920),
-        "address": "280 Woodlands Industrial Park E5 #01-45/46, Harvest Building, Singapore 757322",
-        "tel": "6760 0365"
-    },
-    "KIAW AIK HARDWARE TRADING PTE LTD - 321 Jln Besar": {
-        "coordinates": (1.3098, 103.8571),
-        "address": "321 Jln Besar, Singapore 208979",
-        "tel": "6296 8858"
-    },
-    "MQ HARDWARE & ELECTRICAL TRADING PTE LTD - 3 Toa Payoh Industrial Park": {
-        "coordinates": (1.3323, 103.8518),
-        "address": "3 Toa Payoh Industrial Park, #01-1361, Singapore 319055",
-        "tel": "9665 2756"
-    },
-    "NIRJA MINI MART PTE.LTD - 66 Desker Road": {
-        "coordinates": (1.3077, 103.8559),
-        "address": "66 Desker Road, Singapore 209589",
-        "tel": "8182 3815"
-    },
-    "HAN SIANG HARDWARE PTE LTD - 30 Kelantan Rd": {
-        "coordinates": (1.3056, 103.8583),
-        "address": "30 Kelantan Rd, #01-83, Singapore 200030",
-        "tel": "6294 5395"
-    },
-    "TROSEAL BUILDING MATERIALS PTE LTD - 637 Veerasamy Rd": {
-        "coordinates": (1.3065, 103.8568),
-        "address": "637 Veerasamy Rd, #01-123/125, Singapore 200637",
-        "tel": "6298 1123"
-    },
-    "YIAP HENG CHEONG HARDWARE PTE LTD - 294 Balestier Rd": {
-        "coordinates": (1.3204, 103.8525),
-        "address": "294 Balestier Rd, Singapore 329973",
-        "tel": "6254 4623"
-    },
-    "FRANCE SHOES COMPANY PTE LTD - 1 Park Road, People’s Park Complex": {
-        "coordinates": (1.2852, 103.8442),
-        "address": "1 Park Road, #02-35, People’s Park Complex, Singapore 059108",
-        "tel": "6535 0042"
-    },
-    "TECK MENG HARDWARE PTE LTD - 5030 Ang Mo Kio Ind Park 2": {
-        "coordinates": (1.3687, 103.8602),
-        "address": "5030 Ang Mo Kio Ind Park 2, #01-221, Singapore 569533",
-        "tel": "9763 5706"
-    },
-    "FASTENER GROUP PTE LTD - 8 Kaki Bukit Ave 4, Premier @Kaki Bukit": {
-        "coordinates": (1.3367, 103.9067),
-        "address": "8 Kaki Bukit Ave 4, #03-20, Premier @Kaki Bukit, Singapore 415875",
-        "tel": "6384 6355"
-    },
-    "LEONG SENG INDUSTRIAL PTE LTD - 5070 Ang Mo Kio Ind Park 2": {
-        "coordinates": (1.3693, 103.8591),
-        "address": "5070 Ang Mo Kio Ind Park 2, #01-1491, Singapore 569567",
-        "tel": "6483 2409"
-    },
-    "CHANG TAI CHIANG HARDWARE PTE LTD - 5071 Ang Mo Kio Ind Park 2": {
-        "coordinates": (1.4013, 103.8158),
-        "address": "5071 Ang Mo Kio Ind Park 2, Singapore 787812",
-        "tel": "6481 0231"
-    },
-    "NAM YONG INDUSTRADES - 10 Kaki Bukit Rd 2, First East Centre": {
-        "coordinates": (1.3359, 103.9058),
-        "address": "10 Kaki Bukit Rd 2, #01-02, First East Centre, Singapore 417868",
-        "tel": "6382 5465"
-    },
-    "HORME HARDWARE - 1 Ubi Crescent, Number One Building": {
-        "coordinates": (1.3299, 103.8944),
-        "address": "1 Ubi Crescent #01-01, Number One Building, Singapore 408563",
-        "tel": "6840 8855"
-    },
-    "HORME HARDWARE - 341 Changi Road": {
-        "coordinates": (1.3223, 103.9063),
-        "address": "341 Changi Road, Singapore 419812",
-        "tel": "6840 8844"
-    },
-    "MENG TAT HARDWARE CO - 6 Ubi Road 1, Wintech Centre": {
-        "coordinates": (1.3270, 103.8980),
-        "address": "6 Ubi Road 1 #01-08/09, Wintech Centre, Singapore 408726",
-        "tel": "6292 9484"
-    },
-    "CHIN HOE HUP KEE HARDWARE - 139 Tampines St 11": {
-        "coordinates": (1.3457, 103.9443),
-        "address": "139 Tampines St 11, #01-26, Singapore 521139",
-        "tel": "6785 1910"
-    },
-    "LI FONG HARDWARE ENTERPRISE - 3018 Bedok North Street 5, EastLink": {
-        "coordinates": (1.3341, 103.9531),
-        "address": "3018 Bedok North Street 5, #01-18, EastLink, Singapore 486132",
-        "tel": "6444 6231"
-    },
-    "B&S (2017) HARDWARE PTE LTD - 308 Geylang Road": {
-        "coordinates": (1.3137, 103.8804),
-        "address": "308 Geylang Road, Singapore 389348",
-        "tel": "9616 6571"
-    },
-    "J&E TRADING PTE LTD - 117 Upper East Coast Road": {
-        "coordinates": (1.3125, 103.9228),
-        "address": "117 Upper East Coast Road, #01-01, Singapore 455243",
-        "tel": "8918 0458"
-    },
-    "AGGREGATES ENGINEERING PTE LTD - 3024 Ubi Road 3, Kampong Ubi Industrial Estate": {
-        "coordinates": (1.3302, 103.8981),
-        "address": "3024 Ubi Road 3, #02-71, Kampong Ubi Industrial Estate, Singapore 408652",
-        "tel": "6741 4638 / 69 / 72"
-    }
-}
+    with PHASE_SECONDS.time(phase="nearest_store"):
+        store_name, store_data, distance_km = locator.k_nearest(user_coords, 1)[0]
+    return f"Nearest store: {store_name} ({store_data['address']}, Tel: {store_data['tel']}, Distance: {distance_km:.2f} km)"
 
-# Inject Store Locations into Chat Context (Origginal Code)
-if "store_context" not in st.session_state:
-    store_info = "\n".join(
-        f"{name}: 📍 {info['address']}, 📞 {info['tel']}"
-        for name, info in stores.items()
+# Stores of every country from data/stores.csv (NITTI_STORES_PATH), with their locators and
+# search index prebuilt; edits to the file are picked up without a restart
+@st.cache_resource
+def get_store_registry():
+    registry = StoreRegistry()
+    REGISTRY.gauge(
+        "nitti_stores", "Stores in the loaded dataset per country",
+        lambda: registry.snapshot().counts(), label="country",
     )
-    st.session_state.store_context = [
-        {"role": "system", "content": f"The available store locations are:\n{store_info}"}
-    ]
+    return registry
 
-if "chat_context" not in st.session_state:
-    st.session_state.chat_context = [
-        {'role': 'system', 'content': "You are Tim, a Customer Service AI Chatbot for Nitti Safety Footwear. You assist with store locations and safety footwear inquiries."}
-    ] + st.session_state.store_context
+# This rerun's snapshot; a reload mid-rerun does not change it
+store_snapshot = get_store_registry().snapshot()
 
 # OpenAI communication function (Original Code)
-def get_completion_from_messages(user_messages, model="gpt-3.5-turbo", temperature=0):
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    messages = st.session_state.chat_context + user_messages
-    if any(kw in user_messages[-1]["content"].lower() for kw in ["store", "nearest", "location", "buy", "address"]):
-        store_info = "\n".join(
-            f"{name}: 📍 {info['address']}, 📞 {info['tel']}"
-            for name, info in stores.items()
+# Replies are streamed token-by-token into the bot bubble unless NITTI_STREAM_REPLIES=0.
+# The client honours OPENAI_BASE_URL, so a local fake server can stand in for the API.
+STREAM_REPLIES = os.getenv("NITTI_STREAM_REPLIES", "1") != "0"
+
+@st.cache_resource
+def get_openai_client():
+    """One pooled OpenAI client per process, shared by every session."""
+    return build_client()
+
+# Rate limiting, fair queuing and coalescing across sessions; NITTI_LLM_GATEWAY=0 calls the API directly
+LLM_GATEWAY = os.getenv("NITTI_LLM_GATEWAY", "1") != "0"
+
+@st.cache_resource
+def get_llm_gateway():
+    """The process-wide gateway every session's OpenAI requests go through."""
+    return LLMGateway() if LLM_GATEWAY else None
+
+def build_messages(user_messages, standalone=False):
+    """
+    The prompt for one reply. A standalone question (one whose answer goes into the shared
+    answer cache) is sent with the system prompt and catalog only, without this session's
+    context, earlier turns or summary, so the answer cannot carry this customer's details.
+    """
+    if standalone:
+        user_messages = user_messages[-1:]
+    # Only the catalog chunks matching the latest customer messages are sent
+    recent_questions = " ".join(m["content"] for m in user_messages[-3:] if m["role"] == "user")
+    catalog_context = retrieve_context(recent_questions)
+    session_context = [] if standalone else st.session_state.chat_context
+    system_messages = [SYSTEM_MESSAGE] + session_context + ([catalog_context] if catalog_context else [])
+    if standalone:
+        return system_messages + user_messages
+    return fit_messages(system_messages, user_messages, st.session_state.context_window)
+
+# Store tool results kept per session (oldest dropped first)
+TOOL_CACHE_SIZE = int(os.getenv("NITTI_TOOL_CACHE_SIZE", "32"))
+
+def run_tool(name, arguments):
+    """
+    Runs a store tool call, reusing this session's earlier results for identical calls.
+    Results are keyed on the country and store dataset version too, so a country change
+    or a dataset reload never serves a stale answer.
+    """
+    cache = st.session_state.setdefault("tool_cache", {})
+    key = (name, arguments, country, store_snapshot.version)
+    if key not in cache:
+        while len(cache) >= TOOL_CACHE_SIZE:
+            del cache[next(iter(cache))]
+        stores, index = store_snapshot.searchable(country)
+        cache[key] = run_store_tool(
+            name, arguments, stores, store_snapshot.locator(country),
+            functools.partial(get_coordinates, country=country), index,
         )
-        messages.append({"role": "system", "content": f"Here are the store locations:\n{store_info}"})
-    response = client.chat.completions.create(model=model, messages=messages, temperature=temperature)
-    return response.choices[0].message.content
+    return cache[key]
+
+def tool_options(round_number):
+    # The last round offers no tools, so the loop always ends with a text reply
+    return {"tools": STORE_TOOLS} if round_number < MAX_TOOL_ROUNDS else {}
+
+@st.cache_resource
+def get_model_router():
+    """Model tier choice and hedging state (observed latency, hedge spend), shared per process."""
+    gateway = get_llm_gateway()
+    return ModelRouter(queue_depth=(lambda: gateway.depth) if gateway is not None else None)
+
+def add_usage(usage, reported):
+    """Accumulates the API's token counts over the tool rounds of one reply."""
+    if usage is not None and reported is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + reported.prompt_tokens
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + reported.completion_tokens
+
+def send_completion(client, gateway, session_id, on_admit, **request):
+    """One blocking completion, through the gateway when there is one; `on_admit()` runs once it is admitted."""
+    if gateway is None:
+        on_admit()
+        return create_chat_completion(client, **request)
+    return gateway.complete(session_id, on_admit=on_admit, **request)
+
+def open_completion_stream(client, gateway, session_id, on_admit, **request):
+    """Opens one streamed completion after the gateway admits it, and settles its token usage."""
+    reserved = gateway.admit(session_id, **request) if gateway is not None else 0
+    on_admit()
+    stream = create_chat_completion(client, stream=True, stream_options={"include_usage": True}, **request)
+    try:
+        for chunk in stream:
+            if gateway is not None and getattr(chunk, "usage", None) is not None:
+                gateway.settle(reserved, chunk.usage.total_tokens)
+            yield chunk
+    finally:
+        stream.close()
+
+def get_completion_from_messages(user_messages, model=None, temperature=0, usage=None, standalone=False):
+    messages = build_messages(user_messages, standalone)
+    gateway = get_llm_gateway()
+    router = get_model_router()
+    model = model or router.choose(user_messages)
+    # Hedged requests run on helper threads, so session state is read here, not inside them
+    send = functools.partial(
+        send_completion, None if gateway is not None else get_openai_client(), gateway, st.session_state.session_id
+    )
+    for round_number in range(MAX_TOOL_ROUNDS + 1):
+        request = dict(model=model, messages=messages, temperature=temperature, **tool_options(round_number))
+        with PHASE_SECONDS.time(phase="openai"):
+            response = router.complete(send, **request)
+        add_usage(usage, response.usage)
+        if usage is not None:
+            usage["model"] = response.model
+        message = response.choices[0].message
+        if not message.tool_calls:
+            return message.content
+        calls = [(call.id, call.function.name, call.function.arguments) for call in message.tool_calls]
+        messages += tool_call_messages(calls, run_tool)
+
+def stream_completion_from_messages(user_messages, model=None, temperature=0, usage=None, standalone=False):
+    """
+    Yields the reply text piece by piece as the chat completions stream delivers it.
+    Token counts (and the model that answered) are added to `usage`.
+    """
+    messages = build_messages(user_messages, standalone)
+    router = get_model_router()
+    model = model or router.choose(user_messages)
+    open_stream = functools.partial(
+        open_completion_stream, get_openai_client(), get_llm_gateway(), st.session_state.session_id
+    )
+    for round_number in range(MAX_TOOL_ROUNDS + 1):
+        request = dict(model=model, messages=messages, temperature=temperature, **tool_options(round_number))
+        # Covers the whole streamed call, including the time the caller spends rendering
+        round_started = time.perf_counter()
+        calls = {}
+        for chunk in router.stream(open_stream, **request):
+            add_usage(usage, getattr(chunk, "usage", None))
+            if usage is not None:
+                usage["model"] = chunk.model
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                yield delta.content
+            # Tool calls arrive in fragments keyed by index; stitch them back together
+            for call in delta.tool_calls or []:
+                entry = calls.setdefault(call.index, ["", "", ""])
+                entry[0] = call.id or entry[0]
+                if call.function:
+                    entry[1] += call.function.name or ""
+                    entry[2] += call.function.arguments or ""
+        PHASE_SECONDS.observe(time.perf_counter() - round_started, phase="openai")
+        if not calls:
+            return
+        messages += tool_call_messages([tuple(calls[i]) for i in sorted(calls)], run_tool)
+
+@st.cache_resource
+def get_answer_cache():
+    """Answer cache shared by every session; the SQLite file is shared across worker processes."""
+    cache = AnswerCache()
+    REGISTRY.gauge(
+        "nitti_answer_cache", "Answer cache hit rate and size in this process",
+        lambda: {key: value for key, value in cache.stats().items() if key in ("hit_rate", "entries")},
+        label="stat",
+    )
+    return cache
+
+@st.cache_resource(max_entries=2)
+def get_intent_router(version, _stores):
+    """Deterministic answers for contact, address, store and model-spec questions, per store dataset version."""
+    return IntentRouter(_stores, find_nearest_store)
+
+def generate_reply(history):
+    """
+    Answers the latest user message. Structured questions are answered directly by the
+    intent router, standalone FAQ-style questions from the answer cache when possible
+    (on a miss they are sent without this session's context, as the answer is shared),
+    and everything else goes to the LLM.
+    Returns the reply and a dict of stats for this turn.
+    """
+    question = history[-1]["content"]
+    started = time.perf_counter()
+    usage = {}
+    user_postal = postal if validate_postal(postal, country) else None
+    intent, response = get_intent_router(store_snapshot.version, store_snapshot.stores).route(question, user_postal, country)
+    cacheable = intent is None and is_cacheable(question)
+    if response is None and cacheable:
+        response = get_answer_cache().get(question, PROMPT_VERSION)
+    if response is not None:
+        if STREAM_REPLIES:
+            st.markdown(bubble_html("assistant", response), unsafe_allow_html=True)
+        ttft_ms = (time.perf_counter() - started) * 1000
+        source = f"router:{intent}" if intent else "cache"
+    else:
+        if STREAM_REPLIES:
+            response, ttft_ms = render_streamed_reply(
+                stream_completion_from_messages(history, usage=usage, standalone=cacheable)
+            )
+        else:
+            response = get_completion_from_messages(history, usage=usage, standalone=cacheable)
+            ttft_ms = None
+        source = "llm"
+        if cacheable:
+            get_answer_cache().put(question, PROMPT_VERSION, response, private=[user_postal])
+    REPLIES.inc(source=source)
+    for kind in ("prompt", "completion"):
+        if f"{kind}_tokens" in usage:
+            TOKENS.inc(usage[f"{kind}_tokens"], kind=kind)
+    PHASE_SECONDS.observe(time.perf_counter() - started, phase=f"reply_{source.split(':')[0]}")
+    if ttft_ms is not None:
+        PHASE_SECONDS.observe(ttft_ms / 1000, phase="first_token")
+    return response, {
+        "source": source,
+        "ttft_ms": ttft_ms,
+        "total_ms": (time.perf_counter() - started) * 1000,
+        **usage,
+    }
+
+def render_streamed_reply(chunks):
+    """
+    Renders streamed chunks into a single bot bubble as they arrive.
+    Returns the full reply and the time-to-first-token in milliseconds.
+    """
+    placeholder = st.empty()
+    started = time.perf_counter()
+    ttft_ms = None
+    reply = ""
+    for chunk in chunks:
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - started) * 1000
+        reply += chunk
+        placeholder.markdown(bubble_html("assistant", reply), unsafe_allow_html=True)
+    return reply, ttft_ms
 
 # ===========================
 # User Details Input (Original Code)
@@ -445,38 +479,111 @@ st.markdown("📢 **Enter your contact details before chatting:**")
 
 email = st.text_input("Enter your email:", key="email_input")
 phone = st.text_input("Enter your phone number:", key="phone_input")
-country = st.selectbox("Select Country", ["Singapore", "Malaysia", "Indonesia"], key="country_dropdown")
+country = st.selectbox("Select Country", list(COUNTRY_CODES), key="country_dropdown")
 postal = st.text_input("Enter your postal code (Required if in SG):", key="postal_input")
 
+# ===========================
+# Submission side work: logging, geocoding and the nearest-store search run on a
+# shared worker pool so the chat opens at once. Worker tasks must not call st.*;
+# their results are applied to the session on its own reruns.
+# ===========================
+STORE_LOOKUP_TIMEOUT = float(os.getenv("NITTI_STORE_LOOKUP_TIMEOUT", "5"))  # seconds
+STORE_LOOKUPS = REGISTRY.counter("nitti_store_lookups_total", "Background nearest-store lookups by outcome")
+
+@st.cache_resource
+def get_worker_pool():
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv("NITTI_WORKER_THREADS", "4")), thread_name_prefix="nitti-worker"
+    )
+
+def resolve_store_lookup(wait=0.0):
+    """
+    Injects the nearest-store system message into chat_context once the lookup has
+    finished, waiting up to `wait` seconds for it. A lookup still running after
+    STORE_LOOKUP_TIMEOUT, or one that failed, is replaced by a fallback note that
+    leaves the store question to the find_nearest_store tool. Returns the text to
+    show the customer, or None while the lookup is pending.
+    """
+    pending = st.session_state.get("store_lookup")
+    if pending is None:
+        return st.session_state.get("store_status")
+    future, started, postal_code = pending
+    deadline = started + STORE_LOOKUP_TIMEOUT
+    try:
+        store_info = future.result(timeout=max(0.0, min(wait, deadline - time.time())))
+        STORE_LOOKUPS.inc(outcome="resolved")
+    except FutureTimeout:
+        if time.time() < deadline:
+            return None
+        # A running lookup cannot be cancelled; it finishes on the pool and its result is ignored
+        store_info = None
+        STORE_LOOKUPS.inc(outcome="timeout")
+    except Exception as e:
+        logger.exception("Nearest store lookup failed for %s", postal_code)
+        store_info = None
+        STORE_LOOKUPS.inc(outcome="failed")
+    del st.session_state.store_lookup
+    if store_info is None:
+        content = (f"The nearest store could not be looked up yet. If the user asks for a store, "
+                   f"call find_nearest_store with their postal code {postal_code}.")
+        store_info = "We couldn't look up your nearest store just now. Ask the bot and it will find one for you."
+    else:
+        content = f"The nearest store to the user is: {store_info}"
+    st.session_state.chat_context.append({"role": "system", "content": content})
+    st.session_state.store_status = store_info
+    persist_session()
+    return store_info
+
+@st.fragment(run_every=0.5)
+def store_lookup_status():
+    """
+    Polls the pending lookup without rerunning the rest of the page. Once it resolves,
+    one full rerun replaces the fragment with the static status, which stops the polling.
+    """
+    if resolve_store_lookup() is None:
+        st.markdown("🔎 Finding your nearest store...")
+    else:
+        st.rerun(scope="app")
+
+def show_store_status():
+    """The nearest-store line under the details form, on every rerun once details are saved."""
+    if "store_lookup" in st.session_state:
+        store_lookup_status()
+    elif st.session_state.get("store_status"):
+        st.markdown(f"**{st.session_state.store_status}**", unsafe_allow_html=True)
+
 def validate_and_start():
     if not is_valid_email(email):
         return "❌ Invalid email."
     if not is_valid_phone(phone):
         return "❌ Invalid phone number."
-    if country == "Singapore" and not validate_postal(postal):
+    if (country == "Singapore" or postal) and not validate_postal(postal, country):
         return "❌ Invalid postal code."
     st.session_state.chat_enabled = True
+    remember_contacts(st.session_state.context_window, email, phone)
     
        # LOG USER DATA HERE
-    save_user_data(
-        email=email,
-        phone=phone,
-        postal_code=postal,
-        country=country
-    )
-    
-    if country == "Singapore":
-        store_info = find_nearest_store(postal)
-        st.session_state.chat_context.append(
-            {"role": "system", "content": f"The nearest store to the user is: {store_info}"}
-        )
+    pool = get_worker_pool()
+    pool.submit(save_user_data, email=email, phone=phone, postal_code=postal, country=country)
+
+    st.session_state.pop("store_status", None)
+    if store_snapshot.locator(country) is None:
+        st.session_state.store_status = store_snapshot.notice(country)
+        coverage = store_snapshot.coverage[COUNTRY_CODES[country]]  # the model's note; the customer sees the notice
+        st.session_state.chat_context.append({"role": "system", "content": coverage})
+    elif postal:
+        st.session_state.store_lookup = (pool.submit(find_nearest_store, postal, country), time.time(), postal)
     else:
-        store_info = "No store information available for this country."   
-    return f"✅ **Details saved! {store_info}**"
+        st.session_state.store_status = "Tell the bot your postal code or area to find your nearest store."
+    persist_session()
+    return "✅ **Details saved!**"
 
 if st.button("Submit Details", key="submit_button"):
-    validation_message = validate_and_start()
+    with PHASE_SECONDS.time(phase="submit"):
+        validation_message = validate_and_start()
     st.markdown(validation_message, unsafe_allow_html=True)
+if st.session_state.chat_enabled:
+    show_store_status()
 
 # ===========================
 # CUSTOM UI: Display Chat History with Styled Chat Bubbles
@@ -485,12 +592,9 @@ if st.button("Submit Details", key="submit_button"):
 st.markdown("---")
 st.markdown("**💬 Chat with the Nitti Safety Footwear Bot:**")
 
-with st.container():
-    for chat in st.session_state.chat_history:
-        if chat["role"] == "user":
-            st.markdown(f'<div class="user-message">{chat["content"]}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown(f'<div class="bot-message">{chat["content"]}</div>', unsafe_allow_html=True)
+# Only the latest window of messages is sent to the browser; older ones load on demand
+with st.container(), PHASE_SECONDS.time(phase="render_history"):
+    render_chat_history(st.session_state.chat_history, st.session_state.chat_view)
 
 # ===========================
 # CUSTOM UI: Chat Input Field with Send Button
@@ -509,7 +613,21 @@ if st.session_state.chat_enabled:
     if st.button("Send", key="send_button"):
         if user_input.strip():
             st.session_state.chat_history.append({"role": "user", "content": user_input.strip()})
-            response = get_completion_from_messages(st.session_state.chat_history)
+            if STREAM_REPLIES:
+                st.markdown(bubble_html("user", user_input.strip()), unsafe_allow_html=True)
+            # The first reply should know the nearest store, so give a pending lookup its remaining time
+            resolve_store_lookup(wait=STORE_LOOKUP_TIMEOUT)
+            response, st.session_state.last_reply_stats = generate_reply(st.session_state.chat_history)
             st.session_state.chat_history.append({"role": "assistant", "content": response})
+            with PHASE_SECONDS.time(phase="log_write"):
+                log_turn(
+                    st.session_state.session_id, user_input.strip(), response,
+                    turn=len(st.session_state.chat_history) // 2,
+                    **st.session_state.last_reply_stats
+                )
             st.session_state.chat_input_key += 1
+            persist_session()
+            PHASE_SECONDS.observe(time.perf_counter() - RERUN_STARTED, phase="rerun")
             st.rerun()
+
+PHASE_SECONDS.observe(time.perf_counter() - RERUN_STARTED, phase="rerun")
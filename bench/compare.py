@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+
+# Compares two bench/load_test.py result files phase by phase and fails when the
+# newer run's p95 latency or throughput regresses by more than the threshold.
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two load test results")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    old, new = load(args.baseline), load(args.candidate)
+    print(f"baseline {old.get('commit')}  ->  candidate {new.get('commit')}")
+    regressions = []
+    for phase in sorted(set(old["phases_s"]) | set(new["phases_s"])):
+        before, after = old["phases_s"].get(phase), new["phases_s"].get(phase)
+        if not before or not after or before["p95"] is None or after["p95"] is None:
+            print(f"  {phase:<15} only in one run")
+            continue
+        delta = change(before["p95"], after["p95"])
+        print(f"  {phase:<15} p95 {before['p95'] * 1000:8.1f} -> {after['p95'] * 1000:8.1f} ms ({delta:+.1f}%)")
+        if delta > args.threshold:
+            regressions.append(f"{phase} p95")
+    before = old["throughput"]["chat_turns_per_s"]
+    after = new["throughput"]["chat_turns_per_s"]
+    delta = change(before, after)
+    print(f"  {'throughput':<15} {before:8.2f} -> {after:8.2f} chat turns/s ({delta:+.1f}%)")
+    if -delta > args.threshold:
+        regressions.append("throughput")
+    before = old["memory"]["rss_per_session_kb"]
+    after = new["memory"]["rss_per_session_kb"]
+    print(f"  {'memory':<15} {before:8.0f} -> {after:8.0f} KB per session")
+
+    if regressions:
+        sys.exit(f"Regressed beyond {args.threshold:.0f}%: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    # Usage: python bench/compare.py bench_results/OLD.json bench_results/NEW.json [--threshold 20]
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import hashlib
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Stand-in for Nominatim's /search endpoint:
+#   NOMINATIM_DOMAIN=127.0.0.1:8798 NOMINATIM_SCHEME=http streamlit run app.py
+# Every query resolves to a fixed point inside Singapore derived from its hash.
+
+SG_SOUTH, SG_NORTH = 1.26, 1.44
+SG_WEST, SG_EAST = 103.65, 104.0
+
+
+class FakeNominatimHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/search":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query).get("q", [""])[0]
+        digest = hashlib.sha1(query.encode()).digest()
+        lat = SG_SOUTH + (SG_NORTH - SG_SOUTH) * digest[0] / 255
+        lon = SG_WEST + (SG_EAST - SG_WEST) * digest[1] / 255
+        time.sleep(self.latency)
+        data = json.dumps([{
+            "place_id": int.from_bytes(digest[:4], "big"), "lat": f"{lat:.6f}", "lon": f"{lon:.6f}",
+            "display_name": f"{query} (fake)",
+        }]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    # Usage: python bench/fake_nominatim.py [--port 8798] [--latency 0.2]
+    parser = argparse.ArgumentParser(description="Fake Nominatim geocoding server")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per lookup")
+    args = parser.parse_args()
+    FakeNominatimHandler.latency = args.latency
+    ThreadingHTTPServer(("127.0.0.1", args.port), FakeNominatimHandler).serve_forever()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for the OpenAI chat completions API, for load tests and local runs:
+#   OPENAI_BASE_URL=http://127.0.0.1:8799/v1 streamlit run app.py
+# It answers with a canned reply, streams it word by word when asked to, calls
+# find_nearest_store when tools are offered and the customer mentions a store,
+# and reports token usage roughly (4 characters per token).
+
+REPLY = "Thanks for your question! Our safety shoes come with a 6-month warranty. Is there anything else I can help with?"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0  # seconds before the first byte
+    token_delay = 0.0  # seconds between streamed words
+
+    def log_message(self, *args):
+        pass
+
+    def _send_chunk(self, payload):
+        data = f"data: {payload}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _completion_chunk(self, delta, finish_reason=None):
+        return json.dumps({
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.model = body["model"]
+        messages = body["messages"]
+        last = messages[-1]
+        tool_call = None
+        if body.get("tools") and last["role"] == "user" and "store" in (last["content"] or "").lower():
+            tool_call = {
+                "id": "call_fake", "type": "function",
+                "function": {"name": "find_nearest_store", "arguments": json.dumps({"postal_code": "560123"})},
+            }
+        text = f"Here is what I found: {last['content'][:80]}" if last["role"] == "tool" else REPLY
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = 0 if tool_call else len(text) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        time.sleep(self.latency)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            if tool_call:
+                self._send_chunk(self._completion_chunk({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]}))
+                self._send_chunk(self._completion_chunk({}, "tool_calls"))
+            else:
+                for word in text.split(" "):
+                    self._send_chunk(self._completion_chunk({"content": word + " "}))
+                    time.sleep(self.token_delay)
+                self._send_chunk(self._completion_chunk({}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._send_chunk(json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": self.model, "choices": [], "usage": usage,
+                }))
+            self._send_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        message = {"role": "assistant", "content": None, "tool_calls": [tool_call]} if tool_call else \
+            {"role": "assistant", "content": text}
+        data = json.dumps({
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": self.model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    # Usage: python bench/fake_openai.py [--port 8799] [--latency 0.3] [--token-delay 0.01]
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed words")
+    args = parser.parse_args()
+    FakeOpenAIHandler.latency = args.latency
+    FakeOpenAIHandler.token_delay = args.token_delay
+    ThreadingHTTPServer(("127.0.0.1", args.port), FakeOpenAIHandler).serve_forever()
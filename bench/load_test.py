@@ -0,0 +1,279 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Drives app.py headlessly through Streamlit's AppTest: N simulated customers each
+# load the page, submit their details and hold a multi-turn chat, against the local
+# fake OpenAI and Nominatim servers in this directory. Results are written as JSON
+# so runs from different commits can be compared with bench/compare.py.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+
+# One conversation per session: a greeting, an FAQ, a model question, a store lookup and an open question
+CONVERSATION = [
+    "Hi there",
+    "What is the warranty on your shoes?",
+    "Tell me about 21281",
+    "Which store is nearest to me?",
+    "Which model would you recommend for a wet kitchen floor?",
+    "Can your sales team call me back tomorrow?",
+]
+# Postal codes the sessions cycle through; sector 74 has no bundled centroid, so its lookups reach the fake Nominatim
+POSTAL_CODES = ["560123", "159551", "738099", "470110", "640456", "529510", "748399", "310145"]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples) if samples else None,
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else None,
+    }
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(script, port, *args):
+    process = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, script), "--port", str(port), *args])
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    sys.exit(f"{script} did not start on port {port}")
+
+
+class Session:
+    """One simulated customer with its own AppTest instance, i.e. its own Streamlit session."""
+
+    def __init__(self, index, turns, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.turns = turns
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.timings = {}
+        self.errors = []
+
+    def _timed(self, phase, run):
+        started = time.perf_counter()
+        run()
+        self.timings.setdefault(phase, []).append(time.perf_counter() - started)
+        if self.at.exception:
+            self.errors.append(f"{phase}: {self.at.exception[0].message}")
+
+    def run(self):
+        at = self.at
+        try:
+            self._timed("page_load", at.run)
+            at.text_input(key="email_input").input(f"customer{self.index}@example.com")
+            at.text_input(key="phone_input").input(f"+659{self.index:07d}")
+            at.text_input(key="postal_input").input(POSTAL_CODES[self.index % len(POSTAL_CODES)])
+            self._timed("submit_details", at.button(key="submit_button").click().run)
+            for turn in range(self.turns):
+                message = CONVERSATION[turn % len(CONVERSATION)]
+                chat_input = next(t for t in at.text_input if t.key.startswith("chat_input"))
+                chat_input.input(message)
+                self._timed("chat_turn", at.button(key="send_button").click().run)
+                self._timed("idle_rerun", at.run)
+        except Exception as e:  # keep the other sessions going
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+    def state_bytes(self):
+        try:
+            return len(pickle.dumps(dict(self.at.session_state.filtered_state)))
+        except Exception:
+            return None
+
+
+def run_worker(indices, turns, timeout):
+    """
+    Runs the given sessions one after another in this process and keeps them alive
+    until the end, so the RSS growth reflects what the sessions hold.
+    """
+    from metrics import PHASE_SECONDS
+
+    # Warm-up: imports, cached resources and the first script compile are not what we measure
+    Session(-1, 0, timeout).at.run()
+    PHASE_SECONDS.reset()
+    rss_before = rss_bytes()
+    sessions = []
+    for index in indices:
+        session = Session(index, turns, timeout)
+        session.run()
+        sessions.append(session)
+    timings = {}
+    for session in sessions:
+        for phase, samples in session.timings.items():
+            timings.setdefault(phase, []).extend(samples)
+    return {
+        "sessions": len(sessions),
+        "timings": timings,
+        "errors": [error for s in sessions for error in s.errors],
+        "state_bytes": [size for size in (s.state_bytes() for s in sessions) if size is not None],
+        "rss_growth": rss_bytes() - rss_before,
+        "app_phases": PHASE_SECONDS.snapshot(),
+    }
+
+
+def merge_app_phases(snapshots):
+    """Adds up the app's phase histograms from every worker and recomputes their quantiles."""
+    merged = {}
+    for snapshot in snapshots:
+        for series, stats in snapshot.items():
+            entry = merged.setdefault(series, {"count": 0, "sum": 0.0, "buckets": {}})
+            entry["count"] += stats["count"]
+            entry["sum"] += stats["sum"]
+            for bound, n in stats["buckets"].items():
+                entry["buckets"][bound] = entry["buckets"].get(bound, 0) + n
+    for entry in merged.values():
+        entry["mean"] = entry["sum"] / entry["count"] if entry["count"] else None
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            cumulative, entry[name] = 0, None
+            for bound, n in entry["buckets"].items():
+                cumulative += n
+                if cumulative >= q * entry["count"]:
+                    entry[name] = float(bound)
+                    break
+    return merged
+
+
+def run_benchmark(sessions, turns, concurrency, timeout):
+    """
+    Runs `sessions` simulated customers spread over `concurrency` worker processes.
+    AppTest drives one session at a time per process (it keeps a process-global
+    runtime), so concurrency here means parallel processes hitting the same fakes.
+    """
+    workers = max(1, min(concurrency, sessions))
+    assignments = [list(range(sessions))[w::workers] for w in range(workers)]
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(run_worker, [(indices, turns, timeout) for indices in assignments])
+    elapsed = time.perf_counter() - started
+
+    phases = {}
+    for result in results:
+        for phase, samples in result["timings"].items():
+            phases.setdefault(phase, []).extend(samples)
+    errors = [error for result in results for error in result["errors"]]
+    chat_turns = len(phases.get("chat_turn", []))
+    return {
+        "elapsed_s": elapsed,
+        "throughput": {
+            "sessions_per_s": sessions / elapsed,
+            "chat_turns_per_s": chat_turns / elapsed,
+        },
+        "phases_s": {phase: summarize(samples) for phase, samples in phases.items()},
+        "app_phases_s": merge_app_phases(result["app_phases"] for result in results),
+        "memory": {
+            "rss_per_session_kb": sum(r["rss_growth"] for r in results) / sessions / 1024,
+            "session_state_bytes": summarize([size for r in results for size in r["state_bytes"]]),
+        },
+        "errors": {"count": len(errors), "samples": errors[:10]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test app.py with simulated sessions")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=4, help="chat messages per session")
+    parser.add_argument("--concurrency", type=int, default=4, help="worker processes driving sessions in parallel")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake OpenAI time to first byte (s)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="fake OpenAI delay between words (s)")
+    parser.add_argument("--geocode-latency", type=float, default=0.2, help="fake Nominatim latency (s)")
+    parser.add_argument("--no-stream", action="store_true", help="disable streamed replies")
+    parser.add_argument("--openai-port", type=int, default=8799)
+    parser.add_argument("--nominatim-port", type=int, default=8798)
+    parser.add_argument("--timeout", type=float, default=60, help="AppTest timeout per rerun (s)")
+    parser.add_argument("--output", help="result file (default bench_results/<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="nitti-bench-")
+    # Must be set before app.py and its modules are first imported
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "NOMINATIM_DOMAIN": f"127.0.0.1:{args.nominatim_port}",
+        "NOMINATIM_SCHEME": "http",
+        "NITTI_STREAM_REPLIES": "0" if args.no_stream else "1",
+        "NITTI_ANSWER_CACHE_PATH": os.path.join(workdir, "answer_cache.db"),
+        "NITTI_TRANSCRIPT_DIR": os.path.join(workdir, "transcripts"),
+        "USER_LOG_PATH": os.path.join(workdir, "user_logs.csv"),
+        "NITTI_LEADS_DB_PATH": os.path.join(workdir, "leads.db"),
+    })
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+    servers = [
+        start_server("fake_openai.py", args.openai_port, "--latency", str(args.latency),
+                     "--token-delay", str(args.token_delay)),
+        start_server("fake_nominatim.py", args.nominatim_port, "--latency", str(args.geocode_latency)),
+    ]
+    try:
+        results = run_benchmark(args.sessions, args.turns, args.concurrency, args.timeout)
+    finally:
+        for server in servers:
+            server.terminate()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **results,
+    }
+    output = args.output or os.path.join(
+        REPO_DIR, "bench_results", f"{commit or 'unknown'}-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{args.sessions} sessions x {args.turns} turns in {results['elapsed_s']:.1f}s "
+          f"({results['throughput']['chat_turns_per_s']:.2f} chat turns/s), errors: {results['errors']['count']}")
+    for phase, stats in results["phases_s"].items():
+        print(f"  {phase:<15} p50 {stats['p50'] * 1000:8.1f} ms   p95 {stats['p95'] * 1000:8.1f} ms   "
+              f"p99 {stats['p99'] * 1000:8.1f} ms")
+    print(f"  memory: {results['memory']['rss_per_session_kb']:.0f} KB RSS per session")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    # Usage: python bench/load_test.py [--sessions 20] [--turns 4] [--concurrency 10] [--output FILE]
+    main()
@@ -0,0 +1,288 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+
+# How many catalog chunks are injected per user message, and how close to the
+# best match a chunk must score (as a fraction) to be included
+CATALOG_TOP_K = int(os.getenv("NITTI_CATALOG_TOP_K", "4"))
+CATALOG_MIN_RELATIVE_SCORE = float(os.getenv("NITTI_CATALOG_MIN_RELATIVE_SCORE", "0.5"))
+
+# ✅ Product models
+MODELS = [
+    {
+        "model": "21281", "cut": "Low Cut", "style": "Lace", "color": "Black",
+        "rating": "CE EN 20345:2011 S1P SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Leather", "lining": "Genuine Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Manufacturing & light industrial",
+        "notes": "This model is designed to provide you with extra comfort during those long working hours.",
+    },
+    {
+        "model": "21381", "cut": "Low Cut", "style": "Velcro & Ventilated", "color": "Black or Brown",
+        "rating": "CE EN 20345:2011 S1P SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Manufacturing & light industrial",
+        "notes": "",
+    },
+    {
+        "model": "21981", "cut": "Low Cut", "style": "Slip-on", "color": "Black",
+        "rating": "CE EN 20345:2011 S1P SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Hospitality & kitchens",
+        "notes": "A general purpose and well ventilated model with an industrial grade Velcro strap for added functionality. "
+                 "Improved ventilation to maintain comfort for workers in hot environments.",
+    },
+    {
+        "model": "22281", "cut": "Mid Cut", "style": "Lace", "color": "Black",
+        "rating": "CE EN 20345:2011 S1P SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Light & heavy industrial",
+        "notes": "",
+    },
+    {
+        "model": "22681", "cut": "Mid Cut", "style": "Zipper", "color": "Black",
+        "rating": "CE EN 20345:2011 S3 SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Water Resistant Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Various industrial environments",
+        "notes": "",
+    },
+    {
+        "model": "22781", "cut": "Mid Cut", "style": "Slip-on / Pull-on", "color": "Black and Brown",
+        "rating": "CE EN 20345:2011 S3 SRC (Black) | CE EN 20345:2011 S3 SRC* (Brown)", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Water Resistant Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Petrochemical, oil & gas, marine",
+        "notes": "",
+    },
+    {
+        "model": "23281", "cut": "High Cut", "style": "Pull-on", "color": "Black and Brown",
+        "rating": "CE EN 20345:2011 S3 SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Water Resistant Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Petrochemical, oil & gas, marine",
+        "notes": "",
+    },
+    {
+        "model": "23681", "cut": "High Cut", "style": "Zipper", "color": "Black and Brown",
+        "rating": "CE EN 20345:2011 S3 SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Water Resistant Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Petrochemical, oil & gas, marine",
+        "notes": "",
+    },
+    {
+        "model": "23381", "cut": "High Cut", "style": "Lace", "color": "Black and Brown",
+        "rating": "CE EN 20345:2011 S3 SRC", "size": "2-14 (UK) / 35-48 (EU)",
+        "upper": "Water Resistant Leather", "lining": "Cambrelle®", "outsole": "Direct Injection Polyurethane",
+        "suitable_for": "Mining, plantations, oil & gas",
+        "notes": "",
+    },
+]
+
+# ✅ Policy and company information
+POLICY_SECTIONS = [
+    {
+        "title": "Accessories",
+        "keywords": "accessory accessories socks guard tshirt shirt mousepad",
+        "text": "Accessories: Socks, Shoe Guard, T-shirt, Mouse pad.",
+    },
+    {
+        "title": "Wet and waterproof environments",
+        "keywords": "waterproof water wet rain resistant",
+        "text": "Models to be used in wet and waterproof environments are the mid and high cut models, not the low cut. "
+                "Water resistant leather uppers: 22681, 22781, 23281, 23681, 23381.",
+    },
+    {
+        "title": "Safety ratings by country",
+        "keywords": "rating ratings standard certification certified sni ss gb sirim oshc country",
+        "text": "Safety ratings: Indonesia Rating: SNI 7079-2009. Singapore Rating: SS 513. China Rating: GB 21148. "
+                "Malaysia Rating: Sirim. Other: As/NZS 2210.3.2019 and OSHC.",
+    },
+    {
+        "title": "Direct injection",
+        "keywords": "direct injection injected pu polyurethane sole outsole glue glued bond",
+        "text": "Direct injection is the process where the PU is directly injected into the mold as opposed to glued to the upper of the shoe. "
+                "This ensures a better bond and is of higher quality than non-direct injection.",
+    },
+    {
+        "title": "Warranty",
+        "keywords": "warranty warranted guarantee defect defective months receipt lost international replacement refund",
+        "text": "Nitti Safety Footwear is warranted for six (6) months from the date of invoice by Nitti to its distributors "
+                "against defects in materials and/or workmanship when used under normal conditions for its intended purpose. "
+                "We offer replacements, not refunds. The warranty is valid internationally under the stated conditions. "
+                "If you have lost your receipt, the manufacturing date at the bottom of the sole will be decisive. "
+                "If one side is damaged then both shoes will be replaced.",
+    },
+    {
+        "title": "Return policy",
+        "keywords": "return returns returning policy refund replace replacement defective assessment proof purchase receipt shipping",
+        "text": "As a requirement of the warranty, the purchaser must return the footwear to Nitti or an Authorized distributor "
+                "for assessment together with proof of purchase or receipt. Following assessment, if Nitti determines that "
+                "the footwear is defective as the result of normal use, Nitti will replace the footwear "
+                "(excluding shipping cost, import duties, and taxes).",
+    },
+    {
+        "title": "Boot care",
+        "keywords": "care clean cleaning polish wash washing dry drying sunlight cement maintain maintenance",
+        "text": "Boot care: 1. Do not store your boots in direct sunlight. Always air-dry your boots after use and store them "
+                "in a cool, dry, and well-ventilated place. 2. Clean and polish your boots regularly with wax to enhance durability. "
+                "Be sure to rinse your boots with water after contact with cement. Left unattended, cement will damage the leather "
+                "upper, drying it out and causing cracks to form. 3. Do not wash your boots. Wet boots should be air-dried naturally "
+                "at room temperature with the cushion footbed and laces removed and the boots fully opened. "
+                "Never force dry or use strong detergents or caustic cleaning agents.",
+    },
+    {
+        "title": "The founding of Nitti",
+        "keywords": "founding founded history story founder founders company began started 1998 about",
+        "text": "Nitti was born in 1998 following a preventable accident at the Nitti factory—an incident caused by inferior safety "
+                "footwear. At a time when other brands dominated the market, Nitti emerged as a true underdog. Determined to prevent "
+                "such tragedies and inspired by the need for better protection, a team of dedicated industry professionals set out "
+                "to create safety footwear that combined uncompromising quality with exceptional comfort. Fuelled by tenacity and a "
+                "commitment to customer service, they invested countless hours into research, design, and rigorous testing. Their "
+                "breakthrough products not only prevented further accidents but also redefined industry standards. Over time, Nitti's "
+                "unwavering focus on quality, innovation, and responsive support allowed them to gradually gain trust and grow into "
+                "the market leader they are today. This story of resilience and commitment continues to inspire Nitti's mission—"
+                "ensuring that every pair of safety shoes not only meets the highest standards but also truly protects those who wear them.",
+    },
+]
+
+# Changes whenever any record changes; used to key caches of generated answers
+CATALOG_VERSION = hashlib.sha1(
+    json.dumps([MODELS, POLICY_SECTIONS], sort_keys=True).encode()
+).hexdigest()[:12]
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Spellings customers use that should match the catalog wording
+SYNONYMS = {
+    "lowcut": ["low", "cut"], "midcut": ["mid", "cut"], "highcut": ["high", "cut"],
+    "boot": ["boots"], "shoe": ["shoes"], "zip": ["zipper"], "velcro": ["velcro"],
+    "laces": ["lace"], "slipon": ["slip", "on"], "pullon": ["pull", "on"],
+    "waterproof": ["water", "resistant", "wet"], "guarantee": ["warranty"],
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "do", "does", "for", "i", "in", "is", "it", "me", "my",
+    "of", "on", "or", "the", "to", "what", "which", "with", "you", "your", "about", "tell",
+    "please", "have", "there", "any", "how", "nitti",
+    # store-location questions are answered from the store list, not the catalog
+    "store", "stores",
+}
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        tokens.extend(SYNONYMS.get(token, ()))
+    return tokens
+
+
+def model_text(record):
+    text = (
+        f"{record['model']}, {record['cut']}, Model: {record['style']}, Color: {record['color']}, "
+        f"Rating: {record['rating']}, Size: {record['size']}, Upper: {record['upper']}, "
+        f"Lining: {record['lining']}, Outsole: {record['outsole']}, Suitable for: {record['suitable_for']}"
+    )
+    return f"{text}. {record['notes']}" if record["notes"] else text
+
+
+def build_chunks():
+    chunks = [
+        {"id": record["model"], "text": model_text(record), "keywords": "model models shoe shoes"}
+        for record in MODELS
+    ]
+    chunks += [
+        {"id": section["title"], "text": section["text"], "keywords": section["keywords"]}
+        for section in POLICY_SECTIONS
+    ]
+    return chunks
+
+
+def catalog_overview():
+    """One-line lineup of every model number by cut, small enough to send with every request."""
+    by_cut = {}
+    for record in MODELS:
+        by_cut.setdefault(record["cut"], []).append(record["model"])
+    return "Models: " + "; ".join(f"{cut}: {', '.join(models)}" for cut, models in by_cut.items()) + "."
+
+
+class BM25Index:
+    """Okapi BM25 over short text chunks, built once per process."""
+
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.doc_freqs = []
+        df = Counter()
+        for chunk in chunks:
+            freqs = Counter(tokenize(chunk["text"] + " " + chunk.get("keywords", "")))
+            self.doc_freqs.append(freqs)
+            df.update(freqs.keys())
+        self.lengths = [sum(freqs.values()) for freqs in self.doc_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    def search(self, query, k=CATALOG_TOP_K, min_relative_score=CATALOG_MIN_RELATIVE_SCORE):
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        if not terms:
+            return []
+        scores = []
+        for i, freqs in enumerate(self.doc_freqs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, i))
+        if not scores:
+            return []
+        scores.sort(reverse=True)
+        cutoff = scores[0][0] * min_relative_score
+        return [self.chunks[i] for score, i in scores[:k] if score >= cutoff]
+
+
+catalog_index = BM25Index(build_chunks())
+
+
+MODELS_BY_NUMBER = {record["model"]: record for record in MODELS}
+MODEL_NUMBER_RE = re.compile(r"\b2\d{4}\b")
+CUT_RE = re.compile(r"\b(low|mid|high)[\s-]?cuts?\b")
+LIST_ALL_RE = re.compile(r"\b(all|every|list|lineup|line-up|range|catalogu?e?)\b.*\b(models?|shoes?|boots?|products?)\b"
+                         r"|\bwhat (models|shoes|boots|products) do you\b")
+
+
+def requested_models(query):
+    """
+    The models a query is about: the ones it names by number, or, when it names none,
+    every model of the cuts it asks for ("highcut models") or the whole lineup ("list all your models").
+    """
+    text = query.lower()
+    numbers = set(MODEL_NUMBER_RE.findall(text))
+    if numbers:
+        return [record for record in MODELS if record["model"] in numbers]
+    cuts = {f"{cut.title()} Cut" for cut in CUT_RE.findall(text)}
+    if cuts:
+        return [record for record in MODELS if record["cut"] in cuts]
+    if LIST_ALL_RE.search(text):
+        return list(MODELS)
+    return []
+
+
+def retrieve_context(query):
+    """Returns a system message with the catalog chunks relevant to `query`, or None."""
+    requested = {record["model"] for record in requested_models(query)}
+    named = [chunk for chunk in catalog_index.chunks if chunk["id"] in requested]
+    chunks = named + [chunk for chunk in catalog_index.search(query) if chunk not in named]
+    chunks = chunks[:max(CATALOG_TOP_K, len(named))]
+    if not chunks:
+        return None
+    return {
+        "role": "system",
+        "content": "Relevant product and policy information:\n" + "\n".join(f"- {chunk['text']}" for chunk in chunks),
+    }
@@ -0,0 +1,52 @@
+import html
+import os
+
+import streamlit as st
+
+# How many messages are shown before older ones collapse, and how many each "load earlier" click adds
+CHAT_WINDOW = int(os.getenv("NITTI_CHAT_WINDOW", "20"))
+CHAT_PAGE = int(os.getenv("NITTI_CHAT_PAGE", "20"))
+
+BUBBLE_CLASSES = {"user": "user-message", "assistant": "bot-message"}
+
+
+def bubble_html(role, content):
+    """One escaped chat bubble; newlines become line breaks."""
+    text = html.escape(content).replace("\n", "<br>")
+    return f'<div class="{BUBBLE_CLASSES.get(role, "bot-message")}">{text}</div>'
+
+
+def new_view_state():
+    """Per-session view state: rendered bubbles (parallel to chat_history) and the window size."""
+    return {"html": [], "window": CHAT_WINDOW}
+
+
+def sync_rendered(history, state):
+    """Renders only the messages added since the last rerun; starts over if the history was reset."""
+    rendered = state["html"]
+    if len(rendered) > len(history):
+        rendered.clear()
+        state["window"] = CHAT_WINDOW
+    for message in history[len(rendered):]:
+        rendered.append(bubble_html(message["role"], message["content"]))
+    return rendered
+
+
+def load_earlier(state):
+    state["window"] += CHAT_PAGE
+
+
+def render_chat_history(history, state):
+    """
+    Shows the most recent `state["window"]` messages as a single markdown element,
+    so rerun cost and websocket payload stay flat however long the conversation gets.
+    Older messages sit behind a "load earlier" button.
+    """
+    rendered = sync_rendered(history, state)
+    hidden = max(0, len(rendered) - state["window"])
+    if hidden:
+        # The callback runs before the rerun, so the new window shows on this click
+        st.button(f"⬆️ Load earlier messages ({hidden} hidden)", key="load_earlier",
+                  on_click=load_earlier, args=(state,))
+    if rendered:
+        st.markdown("".join(rendered[hidden:]), unsafe_allow_html=True)
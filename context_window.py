@@ -0,0 +1,116 @@
+import os
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+# Prompt budget (system prompt + summary + recent turns) and how many
+# user/assistant exchanges are always kept verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv("NITTI_CONTEXT_BUDGET", "6000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("NITTI_CONTEXT_KEEP_TURNS", "6"))
+SUMMARY_MAX_TOKENS = int(os.getenv("NITTI_SUMMARY_MAX_TOKENS", "400"))
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+PHONE_RE = re.compile(r"\+?\d[\d -]{7,14}\d")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:  # encodings could not be loaded (e.g. offline)
+            return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text, model="gpt-3.5-turbo"):
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model="gpt-3.5-turbo"):
+    """Chat-format token count: ~4 tokens of framing per message plus 3 for the reply primer."""
+    return sum(4 + count_tokens(m["content"] or "", model) for m in messages) + 3
+
+
+def new_window_state():
+    """Per-session state: running summary lines, pinned contact details and how many messages were folded."""
+    return {"summary": [], "contacts": [], "folded": 0}
+
+
+def remember_contacts(state, *values):
+    """Pins contact details (email, phone, ...) so they survive every summarization."""
+    for value in values:
+        if value and value not in state["contacts"]:
+            state["contacts"].append(value)
+
+
+def _summary_line(message):
+    text = " ".join((message["content"] or "").split())
+    if message["role"] == "user":
+        return f"Customer: {text[:160]}"
+    return f"Nitti: {SENTENCE_RE.split(text, 1)[0][:120]}"
+
+
+def fold_messages(state, messages, model="gpt-3.5-turbo"):
+    """Adds `messages` (the next unfolded ones) to the running summary and pins their contact details."""
+    for message in messages:
+        if message["role"] == "user":
+            if "@" in (message["content"] or ""):  # EMAIL_RE backtracks a lot on long text without one
+                remember_contacts(state, *EMAIL_RE.findall(message["content"]))
+            remember_contacts(state, *(p.strip() for p in PHONE_RE.findall(message["content"] or "")))
+        state["summary"].append(_summary_line(message))
+    # Oldest lines go first; counted line by line so folding many messages at once stays linear
+    summary = state["summary"]
+    tokens = [count_tokens(line, model) + 1 for line in summary]
+    total, drop = sum(tokens), 0
+    while drop < len(summary) - 1 and total > SUMMARY_MAX_TOKENS:
+        total -= tokens[drop]
+        drop += 1
+    del summary[:drop]
+    state["folded"] += len(messages)
+
+
+def summary_message(state):
+    if not state["summary"] and not state["contacts"]:
+        return None
+    parts = []
+    if state["summary"]:
+        parts.append("Summary of the earlier conversation:\n" + "\n".join(f"- {line}" for line in state["summary"]))
+    if state["contacts"]:
+        parts.append("Contact details the customer already provided: " + ", ".join(state["contacts"]))
+    return {"role": "system", "content": "\n".join(parts)}
+
+
+def fit_messages(system_messages, history, state, budget=None, keep_turns=None, model="gpt-3.5-turbo"):
+    """
+    Builds the messages for one request within the token budget.
+    Older turns are folded (once, incrementally) into the running summary in `state`;
+    the last `keep_turns` exchanges stay verbatim, and more are folded only if the
+    budget still overflows. The latest user message is always sent.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    keep_turns = CONTEXT_KEEP_TURNS if keep_turns is None else keep_turns
+    if state["folded"] > len(history):  # history was reset; pinned contacts stay
+        state.update(summary=[], folded=0)
+
+    keep_from = max(state["folded"], len(history) - 2 * keep_turns)
+    fold_messages(state, history[state["folded"]:keep_from], model)
+
+    while True:
+        summary = summary_message(state)
+        messages = list(system_messages) + ([summary] if summary else []) + list(history[state["folded"]:])
+        if state["folded"] >= len(history) - 1 or count_message_tokens(messages, model) <= budget:
+            return messages
+        fold_messages(state, history[state["folded"]:min(state["folded"] + 2, len(history) - 1)], model)
@@ -0,0 +1,105 @@
+import csv
+import os
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SG_CODES_FILE = os.path.join(DATA_DIR, "sg_postal_codes.csv")
+SG_SECTORS_FILE = os.path.join(DATA_DIR, "sg_postal_sectors.csv")
+# Malaysian and Indonesian codes are placed by their first two digits (state/province level)
+PREFIX_FILES = {
+    "MY": os.path.join(DATA_DIR, "my_postal_prefixes.csv"),
+    "ID": os.path.join(DATA_DIR, "id_postal_prefixes.csv"),
+}
+
+POSTAL_CODE_RES = {
+    "SG": re.compile(r"\d{6}"),
+    "MY": re.compile(r"\d{5}"),
+    "ID": re.compile(r"\d{5}"),
+}
+
+
+class PostalIndex:
+    """
+    Sorted, array-backed mapping of integer postal keys to (lat, lon).
+    Lookups are a single binary search over a compact array of ints.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.keys = array("l", (key for key, _, _ in rows))
+        self.lats = array("d", (lat for _, lat, _ in rows))
+        self.lons = array("d", (lon for _, _, lon in rows))
+
+    @classmethod
+    def from_csv(cls, path, key_field):
+        if not os.path.isfile(path):
+            return cls([])
+        with open(path, newline="", encoding="utf-8") as csvfile:
+            return cls(
+                (int(row[key_field]), float(row["latitude"]), float(row["longitude"]))
+                for row in csv.DictReader(csvfile)
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return (self.lats[i], self.lons[i])
+        return None
+
+
+@lru_cache(maxsize=None)
+def load_sg_indexes():
+    """
+    Loads the bundled Singapore tables once per process:
+    exact 6-digit postal codes and 2-digit postal sector centroids.
+    """
+    return (
+        PostalIndex.from_csv(SG_CODES_FILE, "postal_code"),
+        PostalIndex.from_csv(SG_SECTORS_FILE, "sector"),
+    )
+
+
+def geocode_sg_postal(postal_code):
+    """
+    Resolves a 6-digit Singapore postal code to (lat, lon) without any network call.
+    Uses the exact code when bundled, otherwise the centroid of its postal sector.
+    Returns None for codes we cannot place.
+    """
+    postal_code = postal_code.strip()
+    if len(postal_code) != 6 or not postal_code.isdigit():
+        return None
+    codes, sectors = load_sg_indexes()
+    return codes.lookup(int(postal_code)) or sectors.lookup(int(postal_code[:2]))
+
+
+@lru_cache(maxsize=None)
+def load_prefix_index(country_code):
+    """Loads the bundled 2-digit postal prefix centroids for `country_code` once per process."""
+    return PostalIndex.from_csv(PREFIX_FILES[country_code], "prefix")
+
+
+def is_valid_postal(country_code, postal_code):
+    """Checks the postal code format of the given country (SG, MY or ID)."""
+    pattern = POSTAL_CODE_RES.get(country_code)
+    return pattern is not None and pattern.fullmatch(postal_code.strip()) is not None
+
+
+def geocode_postal(country_code, postal_code):
+    """
+    Resolves a postal code of the given country to (lat, lon) without any network call.
+    Singapore codes resolve to the exact code or its sector; Malaysian and Indonesian
+    codes to the centroid of their 2-digit prefix region. Returns None when we cannot
+    place the code or its format is wrong for the country.
+    """
+    if not is_valid_postal(country_code, postal_code):
+        return None
+    postal_code = postal_code.strip()
+    if country_code == "SG":
+        return geocode_sg_postal(postal_code)
+    return load_prefix_index(country_code).lookup(int(postal_code[:2]))
@@ -0,0 +1,257 @@
+import gzip
+import json
+import re
+import sys
+import time
+from collections import Counter
+
+from catalog import MODEL_NUMBER_RE, MODELS_BY_NUMBER, POLICY_SECTIONS, model_text
+
+NITTI_PHONE = "+6580696879"
+NITTI_EMAIL = "enquiry@nittifootwear.com"
+NITTI_ADDRESS = "209 Henderson Road #03-07, Henderson Industrial Park, Singapore 159551"
+FOLLOW_UP = "Is there anything else I can help you with?"
+
+# Postal codes in a message, by the customer's country (6 digits in Singapore, 5 in Malaysia and Indonesia)
+POSTAL_RES = {"Singapore": re.compile(r"\b\d{6}\b"), "Malaysia": re.compile(r"\b\d{5}\b"),
+              "Indonesia": re.compile(r"\b\d{5}\b")}
+CONTACT_RE = re.compile(
+    r"\bhotline\b"
+    r"|\b(your|nitti'?s?|customer service|company)\s+(phone|contact|tel|telephone|email|e-mail|number|whatsapp)"
+    r"|\bhow (can|do) i (contact|reach|call|email|e-mail) (you|nitti)"
+)
+ADDRESS_RE = re.compile(
+    r"\b(your|nitti'?s?|company|office|hq|headquarters?)\s+(address|office|location)"
+    r"|\bwhere (is|are) (nitti|your office|you located|the office)"
+)
+STORE_INTENT_RE = re.compile(r"\b(stores?|shops?|nearest|near|nearby|closest|buy|purchase|outlets?|resellers?)\b")
+NEAREST_RE = re.compile(r"\b(nearest|closest|near me|nearby)\b")
+SPEC_RE = re.compile(r"\b(specs?|specifications?|details?|information|tell me about|describe)\b")
+# Warranty, returns, care, ratings by country, ...: the spec sheet alone does not answer these
+POLICY_WORDS = {word for section in POLICY_SECTIONS for word in section["keywords"].split()} - {"about"}
+WORD_RE = re.compile(r"[a-z0-9]+")
+# A clause asking something besides the spec request ("..., and does it come in size 46?")
+CLAUSE_RE = re.compile(r"[?.!;,]|\b(?:and|also|but)\b")
+# Complaints and stock questions name a store but are not lookups ("I bought from Horme and ...")
+COMPLAINT_WORDS = {
+    "bought", "broke", "broken", "damaged", "faulty", "torn", "problem", "issue", "complain", "complaint",
+    "stock", "stocks", "available", "availability", "size", "sizes",
+}
+QUESTION_RE = re.compile(r"\b(what|how|when|where|who|which|can|could|do|does|did|is|are|will|would|if)\b")
+# Questions that need judgement rather than a lookup stay with the LLM
+OPEN_ENDED_RE = re.compile(
+    r"\b(better|best|compare|comparison|vs|versus|difference|recommend|suitable|suit|should|which one|why|price|cost)\b"
+)
+BRAND_WORD_RE = re.compile(r"[^a-z0-9&\s]")
+NAME_SUFFIX_RE = re.compile(r"\b(pte\.?\s*ltd|pte|ltd|co|\(\d+\))\b|[^a-z0-9&\s]")
+
+
+def store_brand(name):
+    """'HORME HARDWARE - 341 Changi Road' -> 'horme hardware'"""
+    brand = NAME_SUFFIX_RE.sub(" ", name.split(" - ")[0].lower())
+    return " ".join(brand.split())
+
+
+def is_plain_lookup(text, about, blocked=POLICY_WORDS):
+    """
+    Whether a message asks for one lookup and nothing else: none of the `blocked`
+    words (warranty, returns, care, ...) and no clause asking something that
+    `about(clause)` does not recognise as part of the lookup.
+    """
+    if blocked.intersection(WORD_RE.findall(text)):
+        return False
+    return not any(QUESTION_RE.search(clause) and not about(clause) for clause in CLAUSE_RE.split(text))
+
+
+def is_spec_request(text):
+    """A message naming a model that asks for its spec sheet and nothing else."""
+    return is_plain_lookup(text, lambda clause: MODEL_NUMBER_RE.search(clause) or SPEC_RE.search(clause))
+
+
+def is_store_request(text, brand):
+    """A message asking for one store brand's address or phone: no models, complaints or nearest-store search."""
+    if MODEL_NUMBER_RE.search(text) or NEAREST_RE.search(text) or any(r.search(text) for r in POSTAL_RES.values()):
+        return False
+    return is_plain_lookup(text, lambda clause: brand in clause, POLICY_WORDS | COMPLAINT_WORDS)
+
+
+def is_nearest_request(text, postal_re):
+    """A message asking for the nearest store and nothing else: no models, complaints or other questions."""
+    if MODEL_NUMBER_RE.search(text):
+        return False
+    return is_plain_lookup(
+        text, lambda clause: STORE_INTENT_RE.search(clause) or postal_re.search(clause), POLICY_WORDS | COMPLAINT_WORDS
+    )
+
+
+class IntentRouter:
+    """
+    Answers structured questions (Nitti contact details, office address, store
+    address/phone, nearest store, model specs) directly from in-process data.
+    `nearest_store(postal_code, country)` returns a formatted nearest-store string.
+    """
+
+    def __init__(self, stores, nearest_store):
+        self.stores = stores
+        self.nearest_store = nearest_store
+        self.brands = {}
+        for name in stores:
+            brand = store_brand(name)
+            if len(brand.split()) >= 2:
+                self.brands.setdefault(brand, []).append(name)
+        # Brands are matched as word n-grams, so the cost does not grow with the number of stores
+        self.brand_lengths = sorted({len(brand.split()) for brand in self.brands}, reverse=True)
+
+    def find_brand(self, text):
+        """The leftmost, then longest, store brand mentioned in `text`, or None."""
+        words = BRAND_WORD_RE.sub(" ", text).split()
+        for i in range(len(words)):
+            for n in self.brand_lengths:
+                brand = " ".join(words[i:i + n])
+                if brand in self.brands:
+                    return brand
+        return None
+
+    def classify(self, message, postal_code=None, country="Singapore"):
+        """
+        Returns (intent, match) for messages we can answer exactly, else (None, None).
+        `postal_code` is the one given with the contact details (in `country`), used
+        when the message has none.
+        """
+        text = " ".join(message.lower().split())
+        if OPEN_ENDED_RE.search(text):
+            return None, None
+        if CONTACT_RE.search(text):
+            return "contact", None
+        if ADDRESS_RE.search(text):
+            return "company_address", None
+        brand = self.find_brand(text)
+        if brand:
+            return ("store_details", brand) if is_store_request(text, brand) else (None, None)
+        postal_re = POSTAL_RES.get(country, POSTAL_RES["Singapore"])
+        postal = postal_re.search(text)
+        if (STORE_INTENT_RE.search(text) and postal) or (postal_code and NEAREST_RE.search(text)):
+            if not is_nearest_request(text, postal_re):
+                return None, None
+            return "nearest_store", (postal.group(0) if postal else postal_code, country)
+        models = [m for m in MODEL_NUMBER_RE.findall(text) if m in MODELS_BY_NUMBER]
+        if models and (SPEC_RE.search(text) or MODEL_NUMBER_RE.sub("", text).strip(" ?.,!") == ""):
+            if not is_spec_request(text):
+                return None, None
+            return "model_specs", models
+        return None, None
+
+    def answer(self, intent, match):
+        if intent == "contact":
+            return (f"You can reach Nitti Customer Service at {NITTI_PHONE}, "
+                    f"or email us at {NITTI_EMAIL}. {FOLLOW_UP}")
+        if intent == "company_address":
+            return f"Our office is at {NITTI_ADDRESS}. {FOLLOW_UP}"
+        if intent == "store_details":
+            lines = [f"{name}: 📍 {self.stores[name]['address']}, 📞 {self.stores[name]['tel']}"
+                     for name in self.brands[match]]
+            return "\n".join(lines + [FOLLOW_UP])
+        if intent == "nearest_store":
+            result = self.nearest_store(*match)
+            if result.endswith("?"):  # already asks the customer something (e.g. no stores in their country)
+                return result
+            return f"{result.rstrip('.')}. {FOLLOW_UP}"
+        if intent == "model_specs":
+            lines = [model_text(MODELS_BY_NUMBER[m]) for m in dict.fromkeys(match)]
+            return "\n".join(lines + ["Which model would you like to know more about?"])
+        return None
+
+    def route(self, message, postal_code=None, country="Singapore"):
+        """Returns (intent, answer) when the message can be answered without the LLM, else (None, None)."""
+        intent, match = self.classify(message, postal_code, country)
+        if intent is None:
+            return None, None
+        return intent, self.answer(intent, match)
+
+
+def iter_user_messages(path):
+    """
+    Reads user messages from a JSONL transcript (`user` or role/content fields), a
+    gzip-compressed transcript segment, or a plain text file.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, mode="rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                if record.get("user"):
+                    yield record["user"]
+                elif record.get("role") == "user" and record.get("content"):
+                    yield record["content"]
+            else:
+                yield line
+
+
+def replay(router, messages):
+    """Classifies every message and reports how much traffic the router deflects from the API."""
+    intents = Counter()
+    total = 0
+    started = time.perf_counter()
+    for message in messages:
+        total += 1
+        intent, _ = router.classify(message)
+        intents[intent or "llm"] += 1
+    elapsed = time.perf_counter() - started
+    deflected = total - intents["llm"]
+    return {
+        "messages": total,
+        "deflected": deflected,
+        "deflected_share": deflected / total if total else 0.0,
+        "intents": dict(intents),
+        "avg_classify_us": elapsed / total * 1e6 if total else 0.0,
+    }
+
+
+def check(router, path):
+    """
+    Classifies the labelled messages in a JSONL corpus ({"user": ..., "intent": ...},
+    null for the LLM, optionally with the profile's "postal_code" and "country") and
+    returns those routed differently, as (message, expected, got).
+    """
+    mismatches = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                intent, _ = router.classify(
+                    record["user"], record.get("postal_code"), record.get("country", "Singapore")
+                )
+                if intent != record["intent"]:
+                    mismatches.append((record["user"], record["intent"], intent))
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Usage: python intent_router.py replay <transcripts.jsonl | messages.txt> ...
+    #        python intent_router.py check bench/intent_corpus.jsonl
+    if len(sys.argv) < 3 or sys.argv[1] not in ("replay", "check"):
+        sys.exit("Usage: python intent_router.py replay|check FILE [FILE ...]")
+    from geocoder import geocode_postal
+    from store_registry import COUNTRY_CODES, StoreRegistry
+
+    snapshot = StoreRegistry().snapshot()
+
+    def nearest_store(postal_code, country):
+        coords = geocode_postal(COUNTRY_CODES[country], postal_code)
+        locator = snapshot.locator(country)
+        if not coords or locator is None:
+            return "Could not find location."
+        name, info, km = locator.k_nearest(coords, 1)[0]
+        return f"Nearest store: {name} ({info['address']}, Tel: {info['tel']}, Distance: {km:.2f} km)"
+
+    router = IntentRouter(snapshot.stores, nearest_store)
+    if sys.argv[1] == "check":
+        mismatches = [m for path in sys.argv[2:] for m in check(router, path)]
+        for message, expected, got in mismatches:
+            print(f"{message!r}: expected {expected}, got {got}")
+        sys.exit(1 if mismatches else 0)
+    messages = (message for path in sys.argv[2:] for message in iter_user_messages(path))
+    print(json.dumps(replay(router, messages), indent=2))
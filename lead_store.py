@@ -0,0 +1,258 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Lead database and dedupe settings, overridable through the environment
+LEADS_DB_PATH = os.getenv("NITTI_LEADS_DB_PATH", "leads.db")
+# Submissions closer together than this (seconds) count as the same visit, e.g. double clicks
+LEAD_VISIT_GAP = float(os.getenv("NITTI_LEAD_VISIT_GAP", "1800"))
+
+CALLING_CODES = {"Singapore": "65", "Malaysia": "60", "Indonesia": "62"}
+EXPORT_FIELDS = [
+    "email", "phone", "postal_code", "country", "first_seen", "last_seen", "visits", "change_seq", "other_emails",
+]
+EXPORT_CHUNK = 1000
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def normalize_phone(phone, country=None):
+    """
+    Digits only, with the country calling code: '+65 9123 4567' and '6591234567'
+    are the same number, and a local '012-345 6789' in Malaysia is 60123456789.
+    """
+    phone = (phone or "").strip()
+    digits = re.sub(r"\D", "", phone)
+    if phone.startswith("00"):
+        return digits[2:]
+    if digits.startswith("0") and not phone.startswith("+") and country in CALLING_CODES:
+        return CALLING_CODES[country] + digits[1:]
+    return digits
+
+
+class LeadStore:
+    """
+    One row per customer in SQLite (WAL), indexed by normalized phone, with every
+    normalized email the customer has used in `lead_emails`. A submission goes to
+    the lead of its email, or, for a new email, to the lead with the same phone, so
+    repeat visits, double clicks and changed or mistyped emails update one lead
+    instead of adding rows, and the cost stays flat however many submissions came
+    before. The lead's `email` is the latest one; earlier ones stay findable and are
+    exported as `other_emails`.
+
+    Every insert or update stamps the lead with the next `change_seq`. Writers take
+    the write lock before picking it, so sequence order is commit order and an
+    export can resume from the last sequence number it saw without missing changes.
+    Usable as a log_backend sink (write/close).
+    """
+
+    def __init__(self, path=LEADS_DB_PATH, visit_gap=LEAD_VISIT_GAP):
+        self.path = path
+        self.visit_gap = visit_gap
+        self._local = threading.local()
+        self._conns = []  # every thread's connection, so close() can reach them all
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS leads (
+                id INTEGER PRIMARY KEY,
+                email TEXT NOT NULL UNIQUE,
+                phone TEXT,
+                phone_norm TEXT,
+                postal_code TEXT,
+                country TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                visits INTEGER NOT NULL DEFAULT 1,
+                change_seq INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lead_emails (
+                email TEXT PRIMARY KEY,
+                lead_id INTEGER NOT NULL REFERENCES leads (id)
+            );
+            CREATE INDEX IF NOT EXISTS lead_emails_lead ON lead_emails (lead_id);
+            CREATE INDEX IF NOT EXISTS leads_phone ON leads (phone_norm);
+            CREATE INDEX IF NOT EXISTS leads_change_seq ON leads (change_seq);
+            CREATE TABLE IF NOT EXISTS lead_exports (name TEXT PRIMARY KEY, last_seq INTEGER NOT NULL);
+            -- Databases from before lead_emails existed
+            INSERT OR IGNORE INTO lead_emails (email, lead_id) SELECT email, id FROM leads;
+        """)
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Each connection is only used by its own thread; close() may run on another
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def upsert(self, rows, seen_at=None):
+        """
+        Records a batch of submissions ({email, phone, postal_code, country}) in one
+        transaction and returns how many leads were touched. The latest email, phone,
+        postal code and country win, and earlier emails are kept; `visits` only counts
+        submissions at least `visit_gap` seconds after the previous one.
+        """
+        seen_at = time.time() if seen_at is None else seen_at
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(change_seq), 0) FROM leads").fetchone()[0]
+            touched = 0
+            for row in rows:
+                email = normalize_email(row.get("email"))
+                if not email:
+                    continue
+                seq += 1
+                touched += 1
+                phone = (row.get("phone") or "").strip()
+                phone_norm = normalize_phone(phone, row.get("country"))
+                params = (email, phone, phone_norm, row.get("postal_code"), row.get("country"),
+                          row.get("seen_at", seen_at), seq)
+                lead = conn.execute("SELECT lead_id AS id FROM lead_emails WHERE email = ?", (email,)).fetchone()
+                if lead is None and phone_norm:
+                    lead = conn.execute(
+                        "SELECT id FROM leads WHERE phone_norm = ? ORDER BY last_seen DESC LIMIT 1", (phone_norm,)
+                    ).fetchone()
+                if lead is None:
+                    lead_id = conn.execute("""
+                        INSERT INTO leads (email, phone, phone_norm, postal_code, country, first_seen, last_seen, change_seq)
+                        VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?6, ?7)
+                    """, params).lastrowid
+                else:
+                    lead_id = lead["id"]
+                    conn.execute("""
+                        UPDATE leads SET
+                            email = ?1, phone = ?2, phone_norm = ?3, postal_code = ?4, country = ?5,
+                            visits = visits + (?6 - last_seen >= ?8),
+                            first_seen = MIN(first_seen, ?6),
+                            last_seen = MAX(last_seen, ?6),
+                            change_seq = ?7
+                        WHERE id = ?9
+                    """, (*params, self.visit_gap, lead_id))
+                conn.execute("INSERT OR IGNORE INTO lead_emails (email, lead_id) VALUES (?, ?)", (email, lead_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return touched
+
+    # log_backend sink interface
+    def write(self, rows):
+        self.upsert(rows)
+
+    def close(self):
+        """Closes every thread's connection (e.g. the batch writer's, at shutdown)."""
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+    def find(self, email=None, phone=None, country=None):
+        """Leads matching a normalized email (current or earlier) or phone; both lookups use an index."""
+        if email:
+            return self._conn().execute(
+                "SELECT leads.* FROM lead_emails JOIN leads ON leads.id = lead_emails.lead_id WHERE lead_emails.email = ?",
+                (normalize_email(email),),
+            ).fetchall()
+        return self._conn().execute(
+            "SELECT * FROM leads WHERE phone_norm = ? ORDER BY last_seen DESC", (normalize_phone(phone, country),)
+        ).fetchall()
+
+    def iter_changes(self, since_seq=0):
+        """Yields leads changed after `since_seq`, oldest change first, reading in chunks via the index."""
+        conn = self._conn()
+        while True:
+            chunk = conn.execute(
+                "SELECT *, (SELECT group_concat(alias.email, ';') FROM lead_emails alias "
+                "WHERE alias.lead_id = leads.id AND alias.email != leads.email) AS other_emails "
+                "FROM leads WHERE change_seq > ? ORDER BY change_seq LIMIT ?", (since_seq, EXPORT_CHUNK)
+            ).fetchall()
+            if not chunk:
+                return
+            yield from chunk
+            since_seq = chunk[-1]["change_seq"]
+
+    def export_changes(self, out, name="default", full=False):
+        """
+        Streams the leads changed since this export `name` last ran to `out` as CSV,
+        then advances its cursor. Returns the number of leads written.
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT last_seq FROM lead_exports WHERE name = ?", (name,)).fetchone()
+        since = 0 if full or row is None else row["last_seq"]
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_FIELDS)
+        count, last_seq = 0, since
+        for lead in self.iter_changes(since):
+            writer.writerow([
+                lead["email"], lead["phone"], lead["postal_code"], lead["country"],
+                time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(lead["first_seen"])),
+                time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(lead["last_seen"])),
+                lead["visits"], lead["change_seq"], lead["other_emails"] or "",
+            ])
+            count, last_seq = count + 1, lead["change_seq"]
+        out.flush()
+        # Only moved once everything up to last_seq has been written out
+        conn.execute(
+            "INSERT INTO lead_exports (name, last_seq) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET last_seq = excluded.last_seq",
+            (name, last_seq),
+        )
+        return count
+
+    def import_csv(self, path, batch_size=10000):
+        """Backfills leads from a user_logs.csv written by log_backend.CSVSink, streaming it in batches."""
+        seen_at = os.path.getmtime(path)  # the log has no per-row timestamps
+        total, batch = 0, []
+        with open(path, newline="", encoding="utf-8") as csvfile:
+            for row in csv.DictReader(csvfile):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    total += self.upsert(batch, seen_at)
+                    batch = []
+        if batch:
+            total += self.upsert(batch, seen_at)
+        return total
+
+
+if __name__ == "__main__":
+    # Usage: python lead_store.py export [--name sales] [--full] [--out leads.csv]
+    #        python lead_store.py find EMAIL_OR_PHONE
+    #        python lead_store.py import user_logs.csv
+    parser = argparse.ArgumentParser(description="Deduplicated customer leads")
+    parser.add_argument("--db", default=LEADS_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the leads changed since the last export as CSV")
+    export.add_argument("--name", default="default", help="export cursor to resume from")
+    export.add_argument("--full", action="store_true", help="export every lead")
+    export.add_argument("--out", help="output file (default stdout)")
+    commands.add_parser("find", help="look a lead up by email or phone").add_argument("key")
+    commands.add_parser("import", help="backfill leads from a user_logs.csv").add_argument("path")
+    args = parser.parse_args()
+
+    store = LeadStore(args.db)
+    if args.command == "export":
+        with open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout as out:
+            count = store.export_changes(out, args.name, args.full)
+        print(f"{count} leads exported", file=sys.stderr)
+    elif args.command == "find":
+        leads = store.find(email=args.key) if "@" in args.key else store.find(phone=args.key)
+        for lead in leads:
+            print(dict(lead))
+    else:
+        print(f"{store.import_csv(args.path)} rows imported")
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import random
+import time
+
+import httpx
+import openai
+
+# Connection pool and timeout settings (seconds), overridable through the environment
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_POOL_CONNECTIONS = int(os.getenv("OPENAI_POOL_CONNECTIONS", "20"))
+OPENAI_POOL_KEEPALIVE = int(os.getenv("OPENAI_POOL_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+# Retry policy for 429 / 5xx / connection errors
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=OPENAI_POOL_CONNECTIONS,
+        max_keepalive_connections=OPENAI_POOL_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_client():
+    """
+    Builds the OpenAI client that the whole process shares.
+    The SDK's own retries are disabled; create_chat_completion handles them.
+    """
+    timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    return openai.OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        timeout=timeout,
+        max_retries=0,
+        http_client=httpx.Client(timeout=timeout, limits=_pool_limits()),
+    )
+
+
+def build_async_client():
+    """Async counterpart of build_client, for code running on an event loop."""
+    timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    return openai.AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        timeout=timeout,
+        max_retries=0,
+        http_client=httpx.AsyncClient(timeout=timeout, limits=_pool_limits()),
+    )
+
+
+def is_retryable(exc):
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def backoff_delay(attempt, exc=None):
+    """
+    Full-jitter exponential backoff. A Retry-After header from the server
+    is honoured as a lower bound.
+    """
+    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, min(OPENAI_BACKOFF_MAX, float(response.headers.get("retry-after", 0))))
+        except ValueError:
+            pass
+    return delay
+
+
+def create_chat_completion(client, **kwargs):
+    """
+    Calls client.chat.completions.create, retrying 429/5xx and connection errors.
+    With stream=True only opening the stream is retried, never a half-read reply.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            return client.chat.completions.create(**kwargs)
+        except Exception as exc:
+            if attempt >= OPENAI_MAX_RETRIES or not is_retryable(exc):
+                raise
+            time.sleep(backoff_delay(attempt, exc))
+
+
+async def acreate_chat_completion(client, **kwargs):
+    """create_chat_completion for an AsyncOpenAI client; waits between retries without blocking the loop."""
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            return await client.chat.completions.create(**kwargs)
+        except Exception as exc:
+            if attempt >= OPENAI_MAX_RETRIES or not is_retryable(exc):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, exc))
@@ -0,0 +1,254 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from context_window import count_message_tokens, count_tokens
+from llm_client import (
+    OPENAI_BACKOFF_MAX, OPENAI_MAX_RETRIES, OPENAI_TIMEOUT, acreate_chat_completion, build_async_client,
+)
+from metrics import REGISTRY
+
+# Account limits shared by every session in this process (0 = unlimited), overridable through the environment
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "3500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "90000"))
+# Completion tokens reserved for a request that sets no max_tokens; corrected once usage is known
+GATEWAY_COMPLETION_ESTIMATE = int(os.getenv("NITTI_GATEWAY_COMPLETION_ESTIMATE", "300"))
+# Longest a request may wait for capacity before it fails instead of piling up
+GATEWAY_QUEUE_TIMEOUT = float(os.getenv("NITTI_GATEWAY_QUEUE_TIMEOUT", "60"))
+# Longest one completion may take once admitted: every attempt timing out, plus the backoff between them
+GATEWAY_REQUEST_TIMEOUT = (OPENAI_MAX_RETRIES + 1) * OPENAI_TIMEOUT + OPENAI_MAX_RETRIES * OPENAI_BACKOFF_MAX
+# Extra time callers wait for the gateway loop beyond the queue and API timeouts before giving up
+GATEWAY_GRACE = 5.0
+
+QUEUE_WAIT = REGISTRY.histogram("nitti_llm_queue_wait_seconds", "Time requests waited in the LLM gateway queue")
+GATEWAY_REQUESTS = REGISTRY.counter(
+    "nitti_llm_gateway_requests_total", "LLM gateway requests by outcome (sent, coalesced, streamed, timeout)"
+)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units evenly over each minute and holds at most a minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available; 0 if they are available now."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        """Returns over-reserved units; a negative amount charges for an underestimate."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class GatewayTimeout(TimeoutError):
+    """No capacity for a request within the gateway's queue timeout."""
+
+
+def estimate_tokens(kwargs):
+    """Prompt tokens (messages plus tool schemas) and the completion tokens the request may use."""
+    tokens = count_message_tokens(kwargs["messages"])
+    if kwargs.get("tools"):
+        tokens += count_tokens(json.dumps(kwargs["tools"]))
+    return tokens + (kwargs.get("max_tokens") or GATEWAY_COMPLETION_ESTIMATE)
+
+
+def request_key(kwargs):
+    return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LLMGateway:
+    """
+    Funnels every session's OpenAI traffic through one asyncio event loop on a
+    dedicated thread. Requests wait in per-session queues served round-robin, so
+    one busy session cannot starve the others, and are released only when the
+    request and token buckets have room. Identical complete() requests already in
+    flight share a single API call. Streamed requests only go through admit(): the
+    caller makes the call itself, so they are rate limited and queued fairly but
+    never coalesced (each carries its own session's history, so duplicates are rare).
+    """
+
+    def __init__(self, rpm=OPENAI_RPM_LIMIT, tpm=OPENAI_TPM_LIMIT, client_factory=build_async_client,
+                 queue_timeout=GATEWAY_QUEUE_TIMEOUT, request_timeout=GATEWAY_REQUEST_TIMEOUT):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.depth = 0
+        self._queues = OrderedDict()  # session id -> deque of (future, tokens, enqueued at)
+        self._inflight = {}
+        # Built here rather than on the loop thread, so a bad configuration (e.g. no
+        # OPENAI_API_KEY) raises to the caller instead of leaving it waiting for a dead thread
+        self.client = client_factory()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="llm-gateway", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        REGISTRY.gauge("nitti_llm_queue_depth", "Requests waiting in the LLM gateway queue", lambda: self.depth)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._scheduler = self._loop.create_task(self._schedule())
+        self._ready.set()
+        self._loop.run_forever()
+
+    # --- called from Streamlit script threads ---
+
+    def complete(self, session_id, on_admit=None, **kwargs):
+        """
+        Blocking chat completion, queued under `session_id`. Returns the ChatCompletion.
+        `on_admit()`, if given, is called (on the gateway thread) once the request leaves the queue.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._complete(session_id, kwargs, on_admit), self._loop)
+        return self._result(future, self.queue_timeout + self.request_timeout + GATEWAY_GRACE)
+
+    def admit(self, session_id, **kwargs):
+        """
+        Blocks until the request described by `kwargs` may be sent, for callers that
+        make the API call themselves (streaming). Returns the tokens reserved for it.
+        """
+        estimate = estimate_tokens(kwargs)
+        future = asyncio.run_coroutine_threadsafe(self._admit(session_id, estimate), self._loop)
+        self._result(future, self.queue_timeout + GATEWAY_GRACE)
+        GATEWAY_REQUESTS.inc(outcome="streamed")
+        return estimate
+
+    @staticmethod
+    def _result(future, timeout):
+        # The loop enforces its own timeouts; this bound only matters if the loop itself is stuck
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            if future.done():  # raised by the request itself (e.g. GatewayTimeout), not by this wait
+                raise
+            future.cancel()
+            raise TimeoutError(f"LLM gateway: no reply within {timeout:.0f}s") from None
+
+    def settle(self, reserved, used):
+        """Corrects the token bucket once a streamed request reports its real usage."""
+        if self.tokens is not None:
+            self._loop.call_soon_threadsafe(self.tokens.refund, reserved - used)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._thread.join()
+        self._loop.close()
+
+    # --- running on the gateway loop ---
+
+    async def _shutdown(self):
+        self._scheduler.cancel()
+        try:
+            await self._scheduler
+        except asyncio.CancelledError:
+            pass
+        await self.client.close()
+        self._loop.call_soon(self._loop.stop)
+
+    async def _complete(self, session_id, kwargs, on_admit=None):
+        key = request_key(kwargs)
+        entry = self._inflight.get(key)
+        if entry is not None:
+            GATEWAY_REQUESTS.inc(outcome="coalesced")
+        else:
+            entry = {"admitted": False, "on_admit": []}
+            entry["task"] = self._loop.create_task(self._send(session_id, kwargs, entry))
+            self._inflight[key] = entry
+            entry["task"].add_done_callback(lambda _: self._inflight.pop(key, None))
+        if on_admit is not None:
+            if entry["admitted"]:
+                on_admit()
+            else:
+                entry["on_admit"].append(on_admit)
+        # Shielded, so one caller giving up does not cancel the call for the others
+        return await asyncio.shield(entry["task"])
+
+    async def _send(self, session_id, kwargs, entry):
+        estimate = estimate_tokens(kwargs)
+        await self._admit(session_id, estimate)
+        entry["admitted"] = True
+        for on_admit in entry["on_admit"]:
+            on_admit()
+        GATEWAY_REQUESTS.inc(outcome="sent")
+        response = await acreate_chat_completion(self.client, **kwargs)
+        if self.tokens is not None and response.usage is not None:
+            self.tokens.refund(estimate - response.usage.total_tokens)
+        return response
+
+    async def _admit(self, session_id, tokens):
+        future = self._loop.create_future()
+        entry = (future, tokens, time.perf_counter())
+        self._queues.setdefault(session_id, deque()).append(entry)
+        self.depth += 1
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            GATEWAY_REQUESTS.inc(outcome="timeout")
+            raise GatewayTimeout(f"LLM gateway: no capacity within {self.queue_timeout:g}s") from None
+        finally:
+            if future.cancelled():  # gave up (timed out or cancelled) while still queued
+                self._dequeue(session_id, entry)
+
+    def _dequeue(self, session_id, entry):
+        queue = self._queues.get(session_id)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            self.depth -= 1
+            if not queue:
+                del self._queues[session_id]
+
+    def _wait_time(self, tokens):
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    async def _schedule(self):
+        while True:
+            if not self._queues:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            session_id, queue = next(iter(self._queues.items()))
+            future, tokens, enqueued = queue[0]  # waiters that gave up have already left the queue
+            delay = self._wait_time(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            queue.popleft()
+            self.depth -= 1
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            QUEUE_WAIT.observe(time.perf_counter() - enqueued)
+            future.set_result(None)
+            # Round-robin: this session goes to the back of the line
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
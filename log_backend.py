@@ -1,24 +1,318 @@
-import csv
-import os
-
-def save_user_data(email, phone, postal_code, country):
-    """
-    Saves the user details into a CSV file called 'user_logs.csv'.
-    If it doesn't exist, we create it; if it does, we append a new row.
-    """
-    file_exists = os.path.isfile('user_logs.csv')
-    with open('user_logs.csv', mode='a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['email', 'phone', 'postal_code', 'country']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        if not file_exists:
-            # Write the header only if the file doesn't exist
-            writer.writeheader()
-
-        # Write the actual user data
-        writer.writerow({
-            'email': email,
-            'phone': phone,
-            'postal_code': postal_code,
-            'country': country
-        })
+import argparse
+import atexit
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from lead_store import LeadStore
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process locking is skipped there
+    fcntl = None
+
+FIELDNAMES = ['email', 'phone', 'postal_code', 'country']
+
+# Sink and batching settings, overridable through the environment
+# Comma-separated: the raw log ("csv" or "sqlite") and/or "leads", the deduplicated lead store
+USER_LOG_SINK = os.getenv("USER_LOG_SINK", "csv,leads")
+USER_LOG_PATH = os.getenv("USER_LOG_PATH", "user_logs.db" if "sqlite" in USER_LOG_SINK.split(",") else "user_logs.csv")
+USER_LOG_BATCH_SIZE = int(os.getenv("USER_LOG_BATCH_SIZE", "50"))
+USER_LOG_FLUSH_INTERVAL = float(os.getenv("USER_LOG_FLUSH_INTERVAL", "1.0"))
+USER_LOG_QUEUE_SIZE = int(os.getenv("USER_LOG_QUEUE_SIZE", "10000"))
+USER_LOG_FSYNC = os.getenv("USER_LOG_FSYNC", "batch")  # "always", "batch" or "never"
+# A batch the sink rejects is retried this many times, backing off exponentially, then spilled to a file
+USER_LOG_RETRIES = int(os.getenv("USER_LOG_RETRIES", "3"))
+USER_LOG_RETRY_BACKOFF = float(os.getenv("USER_LOG_RETRY_BACKOFF", "0.5"))
+USER_LOG_SPILL_PATH = os.getenv("USER_LOG_SPILL_PATH", USER_LOG_PATH + ".failed.jsonl")
+
+logger = logging.getLogger(__name__)
+
+
+class CSVSink:
+    """
+    Appends rows to a CSV file under an exclusive flock, so several processes
+    (or dynos sharing a volume) never interleave rows or write the header twice.
+    """
+
+    def __init__(self, path, fieldnames=FIELDNAMES, fsync=USER_LOG_FSYNC):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.fsync = fsync
+
+    def write(self, rows):
+        with open(self.path, mode='a', newline='', encoding='utf-8') as csvfile:
+            if fcntl is not None:
+                fcntl.flock(csvfile, fcntl.LOCK_EX)
+            try:
+                writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+                # Checked under the lock, so only one writer ever sees an empty file
+                if os.fstat(csvfile.fileno()).st_size == 0:
+                    writer.writeheader()
+                if self.fsync == "always":
+                    for row in rows:
+                        writer.writerow(row)
+                        csvfile.flush()
+                        os.fsync(csvfile.fileno())
+                else:
+                    writer.writerows(rows)
+                    csvfile.flush()
+                    if self.fsync == "batch":
+                        os.fsync(csvfile.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(csvfile, fcntl.LOCK_UN)
+
+    def close(self):
+        pass
+
+
+class SQLiteSink:
+    """Inserts rows into a SQLite table in WAL mode; SQLite handles cross-process locking."""
+
+    def __init__(self, path, fieldnames=FIELDNAMES, fsync=USER_LOG_FSYNC, table="user_logs"):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.table = table
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={'OFF' if fsync == 'never' else 'FULL' if fsync == 'always' else 'NORMAL'}")
+        columns = ", ".join(f"{name} TEXT" for name in fieldnames)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, created_at REAL, {columns})"
+        )
+        self.conn.commit()
+
+    def write(self, rows):
+        placeholders = ", ".join("?" for _ in self.fieldnames)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO {self.table} (created_at, {', '.join(self.fieldnames)}) VALUES (?, {placeholders})",
+                [(time.time(), *(row.get(name) for name in self.fieldnames)) for row in rows],
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class PartialWriteError(Exception):
+    """Some of a TeeSink's sinks failed; `remaining` writes to just those, for a retry."""
+
+    def __init__(self, error, remaining):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.remaining = remaining
+
+
+class TeeSink:
+    """Hands every batch to each of several sinks; one failing does not keep the rows from the others."""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, rows):
+        failed, errors = [], []
+        for sink in self.sinks:
+            try:
+                sink.write(rows)
+            except Exception as e:
+                failed.append(sink)
+                errors.append(e)
+        if errors:
+            raise PartialWriteError(errors[0], TeeSink(failed))
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class BatchWriter:
+    """
+    Bounded in-memory queue drained by one background thread, which hands rows to
+    `sink.write` in batches of up to `batch_size` or every `flush_interval` seconds.
+    Remaining rows are flushed when the process exits.
+
+    A batch the sink rejects is retried up to `retries` times with exponential
+    backoff (only on the sinks that failed, for a TeeSink); one still failing, or
+    failing during shutdown, is appended to `spill_path` as JSON lines, which
+    `python log_backend.py replay` writes to a sink later.
+    """
+
+    def __init__(self, sink, batch_size=USER_LOG_BATCH_SIZE, flush_interval=USER_LOG_FLUSH_INTERVAL,
+                 max_queue=USER_LOG_QUEUE_SIZE, retries=USER_LOG_RETRIES, retry_backoff=USER_LOG_RETRY_BACKOFF,
+                 spill_path=USER_LOG_SPILL_PATH):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, row):
+        with self._flushed:
+            self._pending += 1
+        try:
+            # Backpressure instead of unbounded memory if the sink falls behind
+            self.queue.put(row, timeout=5)
+        except queue.Full:
+            with self._flushed:
+                self._pending -= 1
+            self._deliver([row])
+
+    def _deliver(self, batch):
+        sink = self.sink
+        for attempt in range(self.retries + 1):
+            try:
+                sink.write(batch)
+                return
+            except Exception as e:
+                sink = getattr(e, "remaining", sink)
+                if attempt == self.retries or self._closed:
+                    logger.error("Log writer failed to write %d rows, spilling them to %s: %s",
+                                 len(batch), self.spill_path, e)
+                    break
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning("Log writer failed to write %d rows, retrying in %gs: %s", len(batch), delay, e)
+                time.sleep(delay)
+        try:
+            spill(self.spill_path, batch)
+        except Exception:
+            logger.exception("Log writer lost %d rows: could not spill them to %s", len(batch), self.spill_path)
+
+    def _write(self, batch):
+        self._deliver(batch)
+        with self._flushed:
+            self._pending -= len(batch)
+            self._flushed.notify_all()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = None
+            if row is not None and row is not self:
+                batch.append(row)
+            if batch and (row is None or row is self or len(batch) >= self.batch_size):
+                self._write(batch)
+                batch = []
+            if row is None or not batch:
+                deadline = time.monotonic() + self.flush_interval
+            if row is self:  # shutdown sentinel
+                return
+
+    def flush(self, timeout=None):
+        """Blocks until every row queued so far has been handed to the sink."""
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(self)
+        self._thread.join()
+        self.sink.close()
+
+
+def spill(path, rows):
+    """Appends rows as JSON lines, under a flock like CSVSink, for `replay` to pick up."""
+    with open(path, mode="a", encoding="utf-8") as spillfile:
+        if fcntl is not None:
+            fcntl.flock(spillfile, fcntl.LOCK_EX)
+        try:
+            spillfile.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            spillfile.flush()
+            os.fsync(spillfile.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(spillfile, fcntl.LOCK_UN)
+
+
+def replay(path, sink, batch_size=1000):
+    """Writes the rows spilled to `path` to `sink` in batches and returns how many there were."""
+    total, batch = 0, []
+    with open(path, encoding="utf-8") as spillfile:
+        for line in spillfile:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                sink.write(batch)
+                total, batch = total + len(batch), []
+    if batch:
+        sink.write(batch)
+        total += len(batch)
+    return total
+
+
+def build_sink(kind=USER_LOG_SINK, path=USER_LOG_PATH):
+    sinks = []
+    for name in kind.split(","):
+        name = name.strip()
+        if name == "leads":
+            sinks.append(LeadStore())
+        elif name == "sqlite":
+            sinks.append(SQLiteSink(path))
+        else:
+            sinks.append(CSVSink(path))
+    return sinks[0] if len(sinks) == 1 else TeeSink(sinks)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process-wide writer, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BatchWriter(build_sink())
+        return _writer
+
+
+def save_user_data(email, phone, postal_code, country):
+    """
+    Queues the user details for the background writer, which appends them to
+    'user_logs.csv' and upserts the lead in 'leads.db' (or the configured sinks).
+    Returns without touching the disk.
+    """
+    get_writer().put({
+        'email': email,
+        'phone': phone,
+        'postal_code': postal_code,
+        'country': country
+    })
+
+
+if __name__ == "__main__":
+    # Usage: python log_backend.py replay [user_logs.csv.failed.jsonl] [--sink leads]
+    # Rows only a TeeSink's failing sinks missed should be replayed to just those.
+    parser = argparse.ArgumentParser(description="User log maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="write rows the log writer spilled to the configured sinks")
+    replay_parser.add_argument("path", nargs="?", default=USER_LOG_SPILL_PATH)
+    replay_parser.add_argument("--sink", default=USER_LOG_SINK, help="comma-separated sinks, as USER_LOG_SINK")
+    args = parser.parse_args()
+
+    sink = build_sink(args.sink)
+    try:
+        count = replay(args.path, sink)
+    finally:
+        sink.close()
+    # Set aside only once every row was written, so a failed replay can simply be rerun
+    os.replace(args.path, args.path + ".replayed")
+    print(f"{count} rows replayed from {args.path}")
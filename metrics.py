@@ -0,0 +1,253 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local port for the /metrics (Prometheus text) and /metrics.json endpoints; unset = no server
+METRICS_PORT = int(os.getenv("NITTI_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("NITTI_METRICS_HOST", "127.0.0.1")
+# File the JSON snapshot is written to when the process exits; unset = no dump
+METRICS_DUMP_PATH = os.getenv("NITTI_METRICS_DUMP")
+
+# Upper bounds in seconds, from sub-millisecond lookups up to slow API calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.type = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Gauge:
+    """
+    Reads its value from `read()` at scrape time. With `label`, `read()` returns
+    {label value: number} and each entry becomes its own series.
+    """
+
+    def __init__(self, name, help_text, read, label=None):
+        self.name = name
+        self.help = help_text
+        self.type = "gauge"
+        self.read = read
+        self.label = label
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:  # a failing callback must not break the scrape
+            return []
+        if self.label:
+            return [(self.name, ((self.label, key),), v) for key, v in value.items()]
+        return [(self.name, (), value)]
+
+    def snapshot(self):
+        return {_format_labels(key) or "value": value for _, key, value in self.samples()}
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect plus a few additions under a lock."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _copy(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def samples(self):
+        samples = []
+        for key, (counts, total, count) in self._copy().items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", key + (("le", le),), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+    def snapshot(self):
+        result = {}
+        for key, (counts, total, count) in self._copy().items():
+            result[_format_labels(key) or "all"] = {
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else 0.0,
+                "p50": self._quantile(counts, count, 0.5),
+                "p95": self._quantile(counts, count, 0.95),
+                "p99": self._quantile(counts, count, 0.99),
+                "buckets": dict(zip([repr(b) for b in self.buckets] + ["+Inf"], counts)),
+            }
+        return result
+
+    def _quantile(self, counts, count, q):
+        """Upper bound of the bucket holding the q-quantile (None when it falls past the last bucket)."""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            if cumulative >= rank:
+                return bound
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args)
+            return self._metrics[name]
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def gauge(self, name, help_text, read, label=None):
+        # Re-registering replaces the callback, e.g. when a cached resource is rebuilt
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, read, label)
+            return self._metrics[name]
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+
+# Shared metrics recorded by app.py and the modules it calls
+PHASE_SECONDS = REGISTRY.histogram("nitti_phase_seconds", "Time spent in each phase of a rerun or reply")
+REPLIES = REGISTRY.counter("nitti_replies_total", "Replies by source (router intent, answer cache or llm)")
+TOKENS = REGISTRY.counter("nitti_tokens_total", "OpenAI tokens used, by kind (prompt or completion)")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = REGISTRY.prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(REGISTRY.snapshot(), indent=2), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serves /metrics and /metrics.json from a daemon thread. Returns the server, or None if disabled."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:  # e.g. another worker process already holds the port
+        print(f"Metrics server not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def dump_json(path):
+    """Writes the current snapshot to `path` as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(REGISTRY.snapshot(), f, indent=2)
+
+
+if METRICS_DUMP_PATH:
+    atexit.register(dump_json, METRICS_DUMP_PATH)
+
+
+if __name__ == "__main__":
+    # Usage: python metrics.py [PORT]  -- fetches /metrics.json from a running app
+    from urllib.request import urlopen
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else METRICS_PORT or 9108
+    with urlopen(f"http://{METRICS_HOST}:{port}/metrics.json") as response:
+        print(response.read().decode())
@@ -0,0 +1,249 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from catalog import MODEL_NUMBER_RE
+from context_window import count_message_tokens
+from intent_router import OPEN_ENDED_RE
+from metrics import REGISTRY
+
+# Model tiers, overridable through the environment
+MODEL_FAST = os.getenv("NITTI_MODEL_FAST", "gpt-3.5-turbo")
+MODEL_STRONG = os.getenv("NITTI_MODEL_STRONG", "gpt-4o-mini")
+MODEL_BACKUP = os.getenv("NITTI_MODEL_BACKUP", "gpt-4o-mini")
+# Messages scoring at least this go to the strong tier (see ModelRouter.complexity)
+COMPLEX_SCORE = float(os.getenv("NITTI_COMPLEX_SCORE", "2"))
+# A tier whose recent time-to-first-token exceeds this is swapped for a faster one
+SLOW_TTFT_MS = float(os.getenv("NITTI_SLOW_TTFT_MS", "4000"))
+# Fire the backup request when the primary has not started answering after this long; 0 disables hedging
+HEDGE_AFTER_MS = float(os.getenv("NITTI_HEDGE_AFTER_MS", "2500"))
+# Most that hedged (duplicate) requests may cost per rolling hour, in USD
+HEDGE_BUDGET_USD = float(os.getenv("NITTI_HEDGE_BUDGET_USD", "0.50"))
+# Completion tokens assumed when reserving budget for a hedge
+HEDGE_COMPLETION_ESTIMATE = 300
+
+# USD per million (prompt, completion) tokens
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+DEFAULT_PRICE = (2.50, 10.00)  # unknown models are priced conservatively
+
+HEDGES = REGISTRY.counter(
+    "nitti_llm_hedges_total", "Hedged requests by outcome (fired, won, lost, skipped_budget, skipped_queue)"
+)
+MODEL_CHOICES = REGISTRY.counter("nitti_llm_model_choices_total", "Model picked for each reply")
+LLM_COST = REGISTRY.counter("nitti_llm_cost_usd_total", "Estimated OpenAI spend, by kind (primary or hedge)")
+
+
+def cost_usd(model, prompt_tokens, completion_tokens=0):
+    prompt_price, completion_price = PRICES.get(model, DEFAULT_PRICE)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class ModelRouter:
+    """
+    Picks a model tier per reply from how complex the customer's message is and how
+    quickly each tier has been answering, and hedges slow requests: when the primary
+    has produced nothing `hedge_after_ms` after it was admitted, the same request goes
+    to the backup model and whichever answers first is used. Hedge spend is capped per
+    rolling hour, and no hedge is sent while `queue_depth()` reports requests waiting for
+    capacity, as a duplicate would only add to the queue.
+    """
+
+    def __init__(self, fast=MODEL_FAST, strong=MODEL_STRONG, backup=MODEL_BACKUP, complex_score=COMPLEX_SCORE,
+                 slow_ttft_ms=SLOW_TTFT_MS, hedge_after_ms=HEDGE_AFTER_MS, hedge_budget_usd=HEDGE_BUDGET_USD,
+                 queue_depth=None):
+        self.fast = fast
+        self.strong = strong
+        self.backup = backup
+        self.complex_score = complex_score
+        self.slow_ttft_ms = slow_ttft_ms
+        self.hedge_after_ms = hedge_after_ms
+        self.hedge_budget_usd = hedge_budget_usd
+        self.queue_depth = queue_depth
+        self.ttft_ms = {}  # model -> moving average of time to first token
+        self._hedge_spend = deque()  # (time, usd) of recent hedges
+        self._lock = threading.Lock()
+
+    # --- tier selection ---
+
+    @staticmethod
+    def complexity(text):
+        """Comparisons/recommendations and several model numbers push a message to the strong tier."""
+        text = text.lower()
+        score = len(text.split()) / 40
+        score += len(set(MODEL_NUMBER_RE.findall(text)))
+        if OPEN_ENDED_RE.search(text):
+            score += 1.5
+        return score
+
+    def choose(self, user_messages):
+        question = next((m["content"] for m in reversed(user_messages) if m["role"] == "user"), "")
+        model = self.strong if self.complexity(question) >= self.complex_score else self.fast
+        other = self.fast if model == self.strong else self.strong
+        with self._lock:
+            slow = self.ttft_ms.get(model, 0) > self.slow_ttft_ms
+            if slow and self.ttft_ms.get(other, 0) < self.ttft_ms[model]:
+                model = other
+        MODEL_CHOICES.inc(model=model)
+        return model
+
+    def record_latency(self, model, ttft_ms):
+        with self._lock:
+            previous = self.ttft_ms.get(model)
+            self.ttft_ms[model] = ttft_ms if previous is None else 0.8 * previous + 0.2 * ttft_ms
+
+    # --- cost tracking ---
+
+    def charge(self, model, prompt_tokens, completion_tokens=0, hedge=False):
+        LLM_COST.inc(cost_usd(model, prompt_tokens, completion_tokens), kind="hedge" if hedge else "primary")
+
+    def _reserve_hedge(self, model, messages):
+        """
+        Books the estimated cost of a hedge against the rolling hourly budget, up front,
+        so concurrent hedges cannot overshoot it. Returns False when it would not fit.
+        """
+        if not self.hedge_after_ms:
+            return False
+        estimate = cost_usd(model, count_message_tokens(messages), HEDGE_COMPLETION_ESTIMATE)
+        now = time.monotonic()
+        with self._lock:
+            while self._hedge_spend and self._hedge_spend[0][0] < now - 3600:
+                self._hedge_spend.popleft()
+            if sum(usd for _, usd in self._hedge_spend) + estimate > self.hedge_budget_usd:
+                HEDGES.inc(outcome="skipped_budget")
+                return False
+            self._hedge_spend.append((now, estimate))
+        return True
+
+    # --- hedged calls ---
+
+    def _race(self, start, request):
+        """
+        Runs start(tag, model, results) for the primary request and, once the hedge
+        deadline passes without an answer (or the primary fails), for the backup.
+        start() reports (tag, "admitted", time) when its request leaves the rate-limit
+        queue; the hedge deadline and the latency clock run from then, so time spent
+        queueing neither triggers hedges nor counts as the model's latency. When the
+        hedge wins, the primary's time so far is recorded as a lower bound of its
+        latency, so a tier that keeps losing stops being chosen.
+        Returns (tag, value) of the first ("primary" or "hedge") to deliver.
+        """
+        results = queue.Queue()
+        models = {"primary": request["model"], "hedge": self.backup}
+        launched = {}
+        admitted = set()
+
+        def launch(tag):
+            launched[tag] = time.perf_counter()
+            threading.Thread(target=start, args=(tag, models[tag], results), daemon=True).start()
+
+        launch("primary")
+        deadline = None  # set once the primary is admitted
+        hedged = not self.hedge_after_ms
+        failures = []
+        while True:
+            timeout = None if hedged or deadline is None else max(0.0, deadline - time.perf_counter())
+            try:
+                tag, kind, value = results.get(timeout=timeout)
+            except queue.Empty:
+                tag, kind, value = None, None, None
+            if kind == "admitted":
+                launched[tag] = value
+                admitted.add(tag)
+                if tag == "primary":
+                    deadline = value + self.hedge_after_ms / 1000
+                continue
+            if kind is not None and kind != "error":
+                now = time.perf_counter()
+                self.record_latency(models[tag], (now - launched[tag]) * 1000)
+                if tag == "hedge" and "primary" in admitted and not failures:
+                    self.record_latency(models["primary"], (now - launched["primary"]) * 1000)
+                if "hedge" in launched:
+                    HEDGES.inc(outcome="won" if tag == "hedge" else "lost")
+                return tag, value
+            if kind == "error":
+                failures.append(value)
+            if not hedged:
+                hedged = True
+                if self.queue_depth is not None and self.queue_depth() > 0:
+                    HEDGES.inc(outcome="skipped_queue")
+                elif self._reserve_hedge(self.backup, request["messages"]):
+                    HEDGES.inc(outcome="fired")
+                    launch("hedge")
+                    continue
+            if len(failures) == len(launched):
+                raise failures[0]
+
+    @staticmethod
+    def _admitted(tag, results):
+        return lambda: results.put((tag, "admitted", time.perf_counter()))
+
+    def complete(self, call, **request):
+        """
+        `call(on_admit, **request)` returns a ChatCompletion and calls `on_admit()` once
+        the request is admitted; the first response to arrive is returned.
+        """
+        def start(tag, model, results):
+            try:
+                response = call(self._admitted(tag, results), **{**request, "model": model})
+            except Exception as exc:
+                results.put((tag, "error", exc))
+                return
+            if response.usage is not None:
+                self.charge(model, response.usage.prompt_tokens, response.usage.completion_tokens,
+                            hedge=tag == "hedge")
+            results.put((tag, "response", response))
+
+        _, response = self._race(start, request)
+        return response
+
+    def stream(self, open_stream, **request):
+        """
+        `open_stream(on_admit, **request)` returns an iterator of chunks and calls
+        `on_admit()` once the request is admitted. Yields the chunks of whichever stream
+        delivers its first chunk first; the other one is closed.
+        """
+        channels = {"primary": queue.Queue(), "hedge": queue.Queue()}
+        decided = {}
+
+        def start(tag, model, results):
+            stream = None
+            first = True
+            try:
+                stream = open_stream(self._admitted(tag, results), **{**request, "model": model})
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None)
+                    if usage is not None:
+                        self.charge(model, usage.prompt_tokens, usage.completion_tokens, hedge=tag == "hedge")
+                    if first:
+                        results.put((tag, "chunk", chunk))
+                        first = False
+                    elif decided.get("winner", tag) != tag:
+                        break  # lost the race
+                    else:
+                        channels[tag].put(chunk)
+            except Exception as exc:
+                if first:
+                    results.put((tag, "error", exc))
+                else:
+                    channels[tag].put(exc)
+            finally:
+                channels[tag].put(None)
+                if stream is not None and hasattr(stream, "close"):
+                    stream.close()
+
+        tag, first_chunk = self._race(start, request)
+        decided["winner"] = tag
+        yield first_chunk
+        while True:
+            chunk = channels[tag].get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
@@ -0,0 +1,194 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from context_window import EMAIL_RE, PHONE_RE, fold_messages
+
+# Backend and limits, overridable through the environment
+SESSION_BACKEND = os.getenv("NITTI_SESSION_BACKEND", "memory")  # "memory", "sqlite" or "none"
+SESSION_DB_PATH = os.getenv("NITTI_SESSION_DB_PATH", "sessions.db")
+SESSION_TTL = float(os.getenv("NITTI_SESSION_TTL", str(2 * 3600)))  # idle expiry in seconds
+SESSION_MAX_BYTES = int(os.getenv("NITTI_SESSION_MAX_BYTES", str(256 * 1024)))
+SESSION_MEMORY_MAX_ENTRIES = int(os.getenv("NITTI_SESSION_MEMORY_MAX_ENTRIES", "10000"))
+
+# The parts of st.session_state that make up a conversation; everything else is rebuilt per browser session
+PERSISTED_KEYS = ("chat_history", "chat_context", "context_window", "chat_enabled")
+
+
+class MemoryBackend:
+    """
+    Process-local backend: survives browser reloads and reconnects, not restarts.
+    Least recently saved sessions are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=SESSION_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (blob, expires at)
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._data[key]
+                return None
+            return entry[0]
+
+    def save(self, key, blob, ttl):
+        with self._lock:
+            self._data[key] = (blob, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires) in self._data.items() if expires < now]:
+                del self._data[key]
+
+
+class SQLiteBackend:
+    """Shared by every worker process on the host; sessions also survive restarts."""
+
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data BLOB, expires REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, key, blob, ttl):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, data, expires) VALUES (?, ?, ?)",
+                (key, blob, time.time() + ttl),
+            )
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def purge(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+
+def trim_history(state, max_bytes):
+    """
+    Encodes the session, dropping its oldest messages until it fits in `max_bytes`.
+    Only the stored copy is trimmed; the live session keeps its full history, which
+    the chat view's rendered bubbles stay aligned with. Dropped messages are folded
+    into the copy's running summary first if they were not already, so a restored
+    session's model still knows about them.
+    """
+    blob = json.dumps(state).encode()
+    history = state.get("chat_history", [])
+    if len(blob) <= max_bytes or len(history) <= 2:
+        return blob
+    # Each message is encoded once and the number to drop worked out from their sizes
+    # (plus the ", " between list items), so a save stays linear in the history length
+    excess = len(blob) - max_bytes
+    drop = 0
+    while drop < len(history) - 2 and excess > 0:
+        excess -= sum(len(json.dumps(message)) + 2 for message in history[drop:drop + 2])
+        drop += 2
+    window = copy.deepcopy(state.get("context_window"))  # its fold counter stays relative to the full history
+    while True:
+        trimmed = dict(state, chat_history=history[drop:])
+        if window:
+            if window["folded"] < drop:
+                fold_messages(window, history[window["folded"]:drop])
+            trimmed["context_window"] = dict(window, folded=window["folded"] - drop)
+        blob = json.dumps(trimmed).encode()
+        # The summary grows with what was folded, so occasionally one more exchange has to go
+        if len(blob) <= max_bytes or drop >= len(history) - 2:
+            return blob
+        drop += 2
+
+
+def mask_contacts(text):
+    return PHONE_RE.sub("[phone]", EMAIL_RE.sub("[email]", text)) if text else text
+
+
+def strip_private(state):
+    """
+    The part of a saved session that may be restored from an id taken from the URL,
+    which anyone given the link can read: no pinned contact details or per-session
+    system context (e.g. the nearest store), and emails and phone numbers masked in
+    the messages and the summary.
+    """
+    state = dict(state)
+    state.pop("chat_context", None)
+    if "chat_history" in state:
+        state["chat_history"] = [dict(m, content=mask_contacts(m.get("content"))) for m in state["chat_history"]]
+    if state.get("context_window"):
+        window = state["context_window"]
+        state["context_window"] = dict(window, contacts=[], summary=[mask_contacts(line) for line in window["summary"]])
+    return state
+
+
+class SessionStore:
+    """
+    Saves and restores the conversation part of a session under its id. Backends
+    only store opaque blobs with a TTL (load/save/delete/purge), so a Redis-like
+    store fits the same interface: load = GET, save = SET with EX=ttl, delete = DEL,
+    purge = no-op. Each save refreshes the idle expiry.
+    """
+
+    def __init__(self, backend, ttl=SESSION_TTL, max_bytes=SESSION_MAX_BYTES):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._saves = 0
+
+    def load(self, session_id):
+        blob = self.backend.load(session_id)
+        return json.loads(blob) if blob else None
+
+    def save(self, session_id, session_state):
+        state = {key: session_state[key] for key in PERSISTED_KEYS if key in session_state}
+        blob = trim_history(state, self.max_bytes)
+        self.backend.save(session_id, blob, self.ttl)
+        self._saves += 1
+        if self._saves % 100 == 0:  # expired sessions are swept now and then, not on every save
+            self.backend.purge()
+        return len(blob)
+
+    def delete(self, session_id):
+        self.backend.delete(session_id)
+
+
+def build_store(kind=SESSION_BACKEND):
+    """The configured store, or None when persistence is off."""
+    if kind == "sqlite":
+        return SessionStore(SQLiteBackend())
+    if kind == "memory":
+        return SessionStore(MemoryBackend())
+    return None
@@ -0,0 +1,93 @@
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Haversine treats the earth as a sphere and can be off from the WGS-84
+# geodesic by up to ~0.5%. Candidate cut-offs are widened by this margin
+# so the exact geodesic re-ranking never drops a true neighbour.
+SPHERE_ERROR = 0.006
+
+# Upper bound on query x store cells computed at once by the batch API.
+BATCH_CELLS = 1_000_000
+
+
+class StoreLocator:
+    """
+    Nearest-store index over a `stores` dict ({name: {"coordinates": (lat, lon), ...}}).
+    Store coordinates are precomputed into NumPy arrays so a query is one vectorized
+    haversine pass; exact geodesic distances are only computed for the final candidates.
+    """
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.names = list(stores)
+        coords = np.array(
+            [stores[name]["coordinates"] for name in self.names], dtype=np.float64
+        ).reshape(-1, 2)
+        self._lat = np.radians(coords[:, 0])
+        self._lon = np.radians(coords[:, 1])
+        self._cos_lat = np.cos(self._lat)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _haversine(self, lat, lon):
+        """Great-circle distances (km) from query point(s) in radians to every store."""
+        dlat = self._lat - lat
+        dlon = self._lon - lon
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat) * self._cos_lat * np.sin(dlon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _exact(self, coords, candidates):
+        """Re-ranks candidate indices by exact geodesic distance."""
+        results = [
+            (self.names[i], self.stores[self.names[i]],
+             geodesic(coords, self.stores[self.names[i]]["coordinates"]).kilometers)
+            for i in candidates
+        ]
+        results.sort(key=lambda result: result[2])
+        return results
+
+    def _k_nearest_from(self, coords, distances, k):
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        kth = np.partition(distances, k - 1)[k - 1]
+        candidates = np.nonzero(distances <= kth * (1 + 2 * SPHERE_ERROR) + 1e-9)[0]
+        return self._exact(coords, candidates)[:k]
+
+    def k_nearest(self, coords, k=1):
+        """Returns the k nearest stores as [(name, store, km), ...], closest first."""
+        lat, lon = np.radians(coords)
+        return self._k_nearest_from(coords, self._haversine(lat, lon), k)
+
+    def within_radius(self, coords, km):
+        """Returns every store within `km` kilometres as [(name, store, km), ...], closest first."""
+        lat, lon = np.radians(coords)
+        distances = self._haversine(lat, lon)
+        candidates = np.nonzero(distances <= km * (1 + SPHERE_ERROR))[0]
+        return [result for result in self._exact(coords, candidates) if result[2] <= km]
+
+    def nearest_many(self, coords_list, k=1):
+        """
+        Batch version of k_nearest. `coords_list` may contain None for points that
+        could not be geocoded; those yield None in the output.
+        """
+        results = [None] * len(coords_list)
+        valid = [i for i, coords in enumerate(coords_list) if coords is not None]
+        if not valid or not self.names:
+            return results
+        points = np.radians(np.array([coords_list[i] for i in valid], dtype=np.float64))
+        rows = max(1, BATCH_CELLS // len(self.names))
+        for start in range(0, len(valid), rows):
+            chunk = points[start:start + rows]
+            matrix = self._haversine(chunk[:, :1], chunk[:, 1:])
+            for offset, distances in enumerate(matrix):
+                i = valid[start + offset]
+                results[i] = self._k_nearest_from(coords_list[i], distances, k)
+        return results
+
+    def nearest_for_postal_codes(self, postal_codes, geocode, k=1):
+        """Geocodes many postal codes with `geocode` and resolves their nearest stores in one pass."""
+        return self.nearest_many([geocode(code) for code in postal_codes], k)
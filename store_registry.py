@@ -0,0 +1,156 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+from store_locator import StoreLocator
+from store_tools import StoreSearchIndex
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# The store dataset (CSV, or JSON with the same fields); replace it with an atomic rename to update it
+STORES_PATH = os.getenv("NITTI_STORES_PATH", os.path.join(DATA_DIR, "stores.csv"))
+# How often, at most, the dataset's modification time is checked for changes (seconds)
+STORES_CHECK_INTERVAL = float(os.getenv("NITTI_STORES_CHECK_INTERVAL", "5"))
+
+COUNTRY_CODES = {"Singapore": "SG", "Malaysia": "MY", "Indonesia": "ID"}
+COUNTRY_NAMES = {code: name for name, code in COUNTRY_CODES.items()}
+
+
+def read_store_rows(path):
+    """
+    Reads the dataset: a CSV file with country,name,address,tel,latitude,longitude
+    columns, or a JSON list of objects with those fields (optionally under "stores").
+    Returns (version, rows); the version is a hash of the file content.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.endswith(".json"):
+        data = json.loads(raw)
+        rows = data["stores"] if isinstance(data, dict) else data
+    else:
+        rows = list(csv.DictReader(io.StringIO(raw.decode("utf-8"))))
+    return hashlib.sha1(raw).hexdigest()[:12], rows
+
+
+class StoreSnapshot:
+    """
+    One load of the dataset with everything derived from it precomputed: the stores
+    per country, their nearest-store locators and search indexes, a prompt
+    snippet on each country's coverage (for the model) and, for countries without
+    stores, the notice shown to the customer. It is never modified after construction, so
+    a rerun can keep using it while a reload swaps in its successor.
+    """
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.stores = {}  # {name: {"coordinates", "address", "tel", "country"}}, all countries
+        self.by_country = {code: {} for code in COUNTRY_NAMES}
+        for row in rows:
+            code = str(row["country"]).strip().upper()
+            if code not in self.by_country:
+                raise ValueError(f"unknown country {row['country']!r} for store {row['name']!r}")
+            if row["name"] in self.stores:
+                raise ValueError(f"duplicate store name {row['name']!r}")
+            info = {
+                "coordinates": (float(row["latitude"]), float(row["longitude"])),
+                "address": row["address"],
+                "tel": row["tel"],
+                "country": code,
+            }
+            self.stores[row["name"]] = info
+            self.by_country[code][row["name"]] = info
+        self.locators = {code: StoreLocator(stores) for code, stores in self.by_country.items() if stores}
+        self.search_indexes = {code: StoreSearchIndex(stores) for code, stores in self.by_country.items()}
+        self.coverage = {code: self._coverage(code) for code in self.by_country}
+        self.notices = {
+            code: f"We don't have resellers in {COUNTRY_NAMES[code]} yet — would you like a sales callback?"
+            for code, stores in self.by_country.items() if not stores
+        }
+
+    def _coverage(self, code):
+        count = len(self.by_country[code])
+        if count:
+            return f"Nitti has {count} resellers in {COUNTRY_NAMES[code]}."
+        return f"No Nitti resellers are listed in {COUNTRY_NAMES[code]} yet; offer a sales callback instead."
+
+    def locator(self, country):
+        """The nearest-store locator for a country name, or None when it has no stores."""
+        return self.locators.get(COUNTRY_CODES.get(country))
+
+    def searchable(self, country):
+        """(stores, search index) of a country name, so searches stay within the customer's country."""
+        code = COUNTRY_CODES.get(country)
+        return self.by_country.get(code, {}), self.search_indexes.get(code) or StoreSearchIndex({})
+
+    def notice(self, country):
+        """The customer-facing note for a country name without stores, or None when it has some."""
+        return self.notices.get(COUNTRY_CODES.get(country))
+
+    def counts(self):
+        return {code: len(stores) for code, stores in self.by_country.items()}
+
+
+class StoreRegistry:
+    """
+    Serves the current StoreSnapshot and reloads it when the dataset file changes,
+    checking the modification time at most every `check_interval` seconds. The new
+    snapshot is built aside and swapped in with a single assignment, so readers never
+    wait and never see a half-built one. A file that fails to load leaves the
+    current snapshot in place.
+    """
+
+    def __init__(self, path=STORES_PATH, check_interval=STORES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self._checked = time.monotonic()
+        version, rows = read_store_rows(path)
+        self._snapshot = StoreSnapshot(rows, version)
+
+    def snapshot(self):
+        if time.monotonic() - self._checked >= self.check_interval:
+            self._check()
+        return self._snapshot
+
+    def _check(self):
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is already checking
+        try:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Loads the dataset now; returns whether the new snapshot was swapped in."""
+        try:
+            version, rows = read_store_rows(self.path)
+            snapshot = StoreSnapshot(rows, version)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Store dataset {self.path} not reloaded: {e}")
+            return False
+        if snapshot.version != self._snapshot.version:
+            self._snapshot = snapshot
+            print(f"Store dataset {self.path} reloaded: version {snapshot.version}, {snapshot.counts()}")
+        return True
+
+
+if __name__ == "__main__":
+    # Usage: python store_registry.py [DATASET]  (checks a dataset before it is deployed)
+    path = sys.argv[1] if len(sys.argv) > 1 else STORES_PATH
+    version, rows = read_store_rows(path)
+    snapshot = StoreSnapshot(rows, version)
+    print(f"{path}: version {snapshot.version}")
+    for code, count in snapshot.counts().items():
+        print(f"  {COUNTRY_NAMES[code]:<10} {count} stores")
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+
+import numpy as np
+
+# Upper bound on model -> tool -> model round trips for a single reply
+MAX_TOOL_ROUNDS = int(os.getenv("NITTI_MAX_TOOL_ROUNDS", "3"))
+MAX_STORE_RESULTS = 5
+
+STORE_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "find_nearest_store",
+            "description": "Find the Nitti resellers closest to a postal code in the customer's country, with the distance in km.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "postal_code": {"type": "string", "description": "Postal code: 6 digits in Singapore, 5 in Malaysia or Indonesia"},
+                    "count": {"type": "integer", "description": "How many stores to return (1-5, default 1)"},
+                },
+                "required": ["postal_code"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_stores",
+            "description": "Search Nitti resellers by area, street, building or store name, e.g. 'Woodlands' or 'Horme'.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Area, street, building or store name"},
+                    "limit": {"type": "integer", "description": "Maximum number of stores to return (1-5, default 3)"},
+                },
+                "required": ["query"],
+            },
+        },
+    },
+]
+
+WORD_RE = re.compile(r"[a-z0-9@]+")
+
+
+def format_store(name, info, distance_km=None):
+    text = f"{name}: 📍 {info['address']}, 📞 {info['tel']}"
+    return f"{text}, Distance: {distance_km:.2f} km" if distance_km is not None else text
+
+
+def _clamp(value, default):
+    try:
+        return max(1, min(MAX_STORE_RESULTS, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+class StoreSearchIndex:
+    """
+    Word -> store postings over a `stores` dict, so a search only counts the stores
+    sharing a word with the query instead of scanning every name and address.
+    """
+
+    def __init__(self, stores):
+        self.names = list(stores)
+        postings = {}
+        for position, name in enumerate(self.names):
+            for word in set(WORD_RE.findall(f"{name} {stores[name]['address']}".lower())):
+                postings.setdefault(word, []).append(position)
+        self.postings = {word: np.array(positions, dtype=np.int32) for word, positions in postings.items()}
+
+    def search(self, query, limit):
+        """Names of the stores matching most query words, ties in dataset order."""
+        hits = [self.postings[word] for word in set(WORD_RE.findall(query.lower())) if word in self.postings]
+        if not hits:
+            return []
+        scores = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        # One sortable key: more matching words first, then earlier in the dataset (non-matches are <= 0)
+        keys = scores.astype(np.int64) * len(self.names) - np.arange(len(self.names))
+        limit = min(limit, int(np.count_nonzero(scores)))
+        top = np.argpartition(-keys, limit - 1)[:limit]
+        return [self.names[i] for i in top[np.argsort(-keys[top])]]
+
+
+def search_stores(stores, query, limit=3, index=None):
+    """
+    Ranks stores by how many query words appear in their name or address.
+    Pass a prebuilt StoreSearchIndex when searching the same stores repeatedly.
+    """
+    if index is None:
+        index = StoreSearchIndex(stores)
+    return [(name, stores[name]) for name in index.search(query, limit)]
+
+
+def run_store_tool(name, arguments, stores, locator, geocode, index=None):
+    """
+    Executes one tool call and returns its result as text for the model. `geocode`
+    returns None for postal codes it cannot place, including malformed ones.
+    """
+    try:
+        args = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return "Invalid tool arguments."
+    if name == "find_nearest_store":
+        if locator is None:
+            return "No Nitti stores are listed in the customer's country yet. Offer a sales callback instead."
+        coords = geocode(str(args.get("postal_code", "")).strip())
+        if coords is None:
+            return "Could not find location for that postal code."
+        results = locator.k_nearest(coords, _clamp(args.get("count"), 1))
+        return "\n".join(format_store(*result) for result in results)
+    if name == "search_stores":
+        results = search_stores(stores, str(args.get("query", "")), _clamp(args.get("limit"), 3), index)
+        if not results:
+            return "No stores matched. Ask the customer for their postal code instead."
+        return "\n".join(format_store(*result) for result in results)
+    return f"Unknown tool: {name}"
+
+
+def tool_call_messages(calls, execute):
+    """
+    Turns the model's tool calls [(id, name, arguments), ...] into the assistant
+    message that requested them plus one tool message per result.
+    """
+    messages = [{
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+            for call_id, name, arguments in calls
+        ],
+    }]
+    for call_id, name, arguments in calls:
+        messages.append({"role": "tool", "tool_call_id": call_id, "content": execute(name, arguments)})
+    return messages
@@ -0,0 +1,79 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from lead_store import LeadStore, normalize_phone
+
+
+class LeadStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = LeadStore(os.path.join(self.dir.name, "leads.db"), visit_gap=60)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def submit(self, email, phone, seen_at, country="Singapore"):
+        self.store.upsert([{"email": email, "phone": phone, "postal_code": "560123", "country": country}], seen_at)
+
+    def count(self):
+        return self.store._conn().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def test_same_email_updates_one_lead(self):
+        self.submit("Alice@Acme.com ", "+65 9123 4567", 0)
+        self.submit("alice@acme.com", "+65 9123 4567", 10)  # double click: same visit
+        self.submit("alice@acme.com", "+65 8123 4567", 100)
+        [lead] = self.store.find(email="alice@acme.com")
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(lead["visits"], 2)
+        self.assertEqual(lead["phone_norm"], "6581234567")
+
+    def test_new_email_with_known_phone_keeps_both_emails(self):
+        self.submit("alice@acme.com", "+65 9123 4567", 0)
+        self.submit("bob@acme.com", "6591234567", 100)
+        self.assertEqual(self.count(), 1)
+        [by_old] = self.store.find(email="alice@acme.com")
+        [by_new] = self.store.find(email="bob@acme.com")
+        self.assertEqual(by_old["id"], by_new["id"])
+        self.assertEqual(by_new["email"], "bob@acme.com")
+        self.assertEqual(by_new["visits"], 2)
+        # Coming back with the earlier email still lands on the same lead
+        self.submit("alice@acme.com", "", 200)
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.store.find(email="bob@acme.com")[0]["email"], "alice@acme.com")
+
+    def test_different_phone_and_email_are_different_leads(self):
+        self.submit("alice@acme.com", "+65 9123 4567", 0)
+        self.submit("carol@acme.com", "+65 9999 0000", 0)
+        self.submit("dave@acme.com", "", 0)  # no phone: never merged by phone
+        self.assertEqual(self.count(), 3)
+
+    def test_export_lists_earlier_emails_and_resumes(self):
+        self.submit("alice@acme.com", "+65 9123 4567", 0)
+        self.submit("bob@acme.com", "+65 9123 4567", 100)
+        out = io.StringIO()
+        self.assertEqual(self.store.export_changes(out, "sales"), 1)
+        header, row = out.getvalue().splitlines()
+        self.assertTrue(row.startswith("bob@acme.com,"))
+        self.assertTrue(row.endswith(",alice@acme.com"))
+        self.assertEqual(self.store.export_changes(io.StringIO(), "sales"), 0)
+
+    def test_close_closes_every_threads_connection(self):
+        thread = threading.Thread(target=self.submit, args=("alice@acme.com", "91234567", 0))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(self.store._conns), 2)
+        self.store.close()
+        self.assertEqual(self.store._conns, [])
+
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone("+65 9123 4567"), "6591234567")
+        self.assertEqual(normalize_phone("0065 9123 4567"), "6591234567")
+        self.assertEqual(normalize_phone("012-345 6789", "Malaysia"), "60123456789")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import types
+import unittest
+
+from llm_gateway import GatewayTimeout, LLMGateway, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "what is the warranty"}]
+
+
+class StubClient:
+    """Stands in for AsyncOpenAI: counts calls and answers after `delay` seconds."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        return types.SimpleNamespace(model=kwargs["model"], usage=usage)
+
+    async def close(self):
+        pass
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_take_wait_and_refund(self):
+        bucket = TokenBucket(60)  # one per second, at most 60
+        self.assertEqual(bucket.wait_time(60), 0.0)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0, places=1)
+        bucket.refund(30)
+        self.assertEqual(bucket.wait_time(30), 0.0)
+
+
+class LLMGatewayTest(unittest.TestCase):
+    def gateway(self, client=None, **options):
+        gateway = LLMGateway(client_factory=lambda: client or StubClient(), **options)
+        self.addCleanup(gateway.close)
+        return gateway
+
+    def test_client_errors_reach_the_caller(self):
+        def broken():
+            raise RuntimeError("no API key")
+        with self.assertRaises(RuntimeError):
+            LLMGateway(client_factory=broken)
+
+    def test_sessions_are_served_round_robin(self):
+        gateway = self.gateway(rpm=3000, tpm=0)  # one release every 20 ms once drained
+        gateway.requests.tokens = 0
+        order = []
+        futures = []
+        for session_id in ("a", "a", "a", "b"):
+            future = asyncio.run_coroutine_threadsafe(gateway._admit(session_id, 1), gateway._loop)
+            future.add_done_callback(lambda _, sid=session_id: order.append(sid))
+            futures.append(future)
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ["a", "b", "a", "a"])
+        self.assertEqual(gateway.depth, 0)
+
+    def test_token_budget_is_reserved_and_settled(self):
+        gateway = self.gateway(rpm=0, tpm=1000)
+        reserved = gateway.admit("a", model="m", messages=MESSAGES, max_tokens=100)
+        self.assertGreater(reserved, 100)
+        gateway.settle(reserved, 20)
+        time.sleep(0.05)
+        self.assertGreater(gateway.tokens.tokens, 1000 - reserved)
+
+    def test_identical_requests_share_one_call(self):
+        client = StubClient(delay=0.2)
+        gateway = self.gateway(client)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(gateway.complete("s", model="m", messages=MESSAGES)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(len(results), 3)
+
+    def test_on_admit_is_called_for_coalesced_callers_too(self):
+        gateway = self.gateway(StubClient(delay=0.1))
+        admitted = []
+        threads = [
+            threading.Thread(target=gateway.complete, args=("s",),
+                             kwargs=dict(on_admit=lambda: admitted.append(1), model="m", messages=MESSAGES))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(admitted), 2)
+
+    def test_queue_timeout_raises_and_frees_the_slot(self):
+        gateway = self.gateway(rpm=1, tpm=0, queue_timeout=0.1)
+        gateway.admit("a", model="m", messages=MESSAGES)  # uses the only request this minute
+        with self.assertRaises(GatewayTimeout):
+            gateway.admit("b", model="m", messages=MESSAGES)
+        self.assertEqual(gateway.depth, 0)
+        self.assertFalse(gateway._queues)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+
+from log_backend import BatchWriter, CSVSink, TeeSink, replay
+
+ROW = {"email": "alice@acme.com", "phone": "+65 9123 4567", "postal_code": "560123", "country": "Singapore"}
+
+
+class FlakySink:
+    """Fails its first `failures` writes."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.batches = []
+
+    def write(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.batches.append(list(rows))
+
+    def close(self):
+        pass
+
+
+class BatchWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.dir.name, "failed.jsonl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def writer(self, sink, retries=2):
+        return BatchWriter(sink, flush_interval=0.01, retries=retries, retry_backoff=0.01, spill_path=self.spill_path)
+
+    def write(self, sink, retries=2):
+        writer = self.writer(sink, retries)
+        with self.assertLogs("log_backend", "WARNING") as logs:
+            writer.put(ROW)
+            self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        return logs.output
+
+    def test_failed_batch_is_retried(self):
+        sink = FlakySink(failures=2)
+        self.write(sink)
+        self.assertEqual(sink.batches, [[ROW]])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_batch_still_failing_is_spilled_and_replayed(self):
+        output = self.write(FlakySink(failures=3))
+        self.assertIn("spilling", output[-1])
+        sink = FlakySink(failures=0)
+        self.assertEqual(replay(self.spill_path, sink), 1)
+        self.assertEqual(sink.batches, [[ROW]])
+
+    def test_tee_retries_only_the_failing_sink(self):
+        csv_path = os.path.join(self.dir.name, "user_logs.csv")
+        flaky = FlakySink(failures=1)
+        self.write(TeeSink([CSVSink(csv_path), flaky]))
+        with open(csv_path, encoding="utf-8") as csvfile:
+            self.assertEqual(len(csvfile.read().splitlines()), 2)  # header and one row
+        self.assertEqual(flaky.batches, [[ROW]])
+
+    def test_spill_keeps_every_row(self):
+        writer = self.writer(FlakySink(failures=100), retries=0)
+        with self.assertLogs("log_backend", "ERROR"):
+            for i in range(5):
+                writer.put(dict(ROW, email=f"user{i}@acme.com"))
+            self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        with open(self.spill_path, encoding="utf-8") as spillfile:
+            emails = [json.loads(line)["email"] for line in spillfile]
+        self.assertEqual(emails, [f"user{i}@acme.com" for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
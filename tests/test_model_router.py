@@ -0,0 +1,106 @@
+import threading
+import time
+import types
+import unittest
+
+from model_router import ModelRouter
+
+MESSAGES = [{"role": "user", "content": "what is the warranty"}]
+
+
+def stub_call(delays, queue_wait=0.0, calls=None):
+    """A `call(on_admit, **request)` answering after delays[model] seconds, once admitted after `queue_wait`."""
+    def call(on_admit, **request):
+        if calls is not None:
+            calls.append(request["model"])
+        time.sleep(queue_wait)
+        on_admit()
+        time.sleep(delays[request["model"]])
+        return types.SimpleNamespace(model=request["model"], usage=None)
+    return call
+
+
+def router(**options):
+    return ModelRouter(**{"fast": "fast", "strong": "strong", "backup": "backup", "hedge_after_ms": 50,
+                          "hedge_budget_usd": 1.0, "slow_ttft_ms": 1000, **options})
+
+
+class TierSelectionTest(unittest.TestCase):
+    def test_simple_questions_go_to_the_fast_tier(self):
+        self.assertEqual(router().choose(MESSAGES), "fast")
+
+    def test_comparisons_go_to_the_strong_tier(self):
+        messages = [{"role": "user", "content": "Which is better for wet sites, 22681 or 23381?"}]
+        self.assertEqual(router().choose(messages), "strong")
+
+    def test_a_slow_tier_is_swapped_for_a_faster_one(self):
+        r = router()
+        r.record_latency("fast", 5000)
+        r.record_latency("strong", 800)
+        self.assertEqual(r.choose(MESSAGES), "strong")
+
+
+class HedgingTest(unittest.TestCase):
+    def test_fast_primary_is_not_hedged(self):
+        calls = []
+        response = router().complete(stub_call({"fast": 0.0}, calls=calls), model="fast", messages=MESSAGES)
+        self.assertEqual(response.model, "fast")
+        self.assertEqual(calls, ["fast"])
+
+    def test_slow_primary_is_hedged_and_its_latency_recorded(self):
+        r = router()
+        response = r.complete(stub_call({"fast": 0.5, "backup": 0.0}), model="fast", messages=MESSAGES)
+        self.assertEqual(response.model, "backup")
+        # The losing primary still counts as slow, so it is not picked again and again
+        self.assertGreaterEqual(r.ttft_ms["fast"], 50)
+
+    def test_queue_wait_neither_hedges_nor_counts_as_latency(self):
+        r = router()
+        calls = []
+        response = r.complete(stub_call({"fast": 0.0}, queue_wait=0.2, calls=calls), model="fast", messages=MESSAGES)
+        self.assertEqual(response.model, "fast")
+        self.assertEqual(calls, ["fast"])
+        self.assertLess(r.ttft_ms["fast"], 50)
+
+    def test_no_hedge_while_requests_are_queued(self):
+        calls = []
+        r = router(queue_depth=lambda: 3)
+        response = r.complete(stub_call({"fast": 0.2, "backup": 0.0}, calls=calls), model="fast", messages=MESSAGES)
+        self.assertEqual(response.model, "fast")
+        self.assertEqual(calls, ["fast"])
+
+    def test_hedges_stop_when_the_budget_is_spent(self):
+        r = router(hedge_budget_usd=0.0)
+        calls = []
+        response = r.complete(stub_call({"fast": 0.2, "backup": 0.0}, calls=calls), model="fast", messages=MESSAGES)
+        self.assertEqual(response.model, "fast")
+        self.assertEqual(calls, ["fast"])
+
+    def test_failed_primary_falls_back_to_the_backup(self):
+        def call(on_admit, **request):
+            on_admit()
+            if request["model"] == "fast":
+                raise ConnectionError("upstream down")
+            return types.SimpleNamespace(model=request["model"], usage=None)
+        self.assertEqual(router().complete(call, model="fast", messages=MESSAGES).model, "backup")
+
+    def test_stream_uses_the_first_stream_to_answer(self):
+        closed = threading.Event()
+
+        def open_stream(on_admit, **request):
+            on_admit()
+            try:
+                time.sleep(0.3 if request["model"] == "fast" else 0.0)
+                for part in ("a", "b"):
+                    yield types.SimpleNamespace(model=request["model"], text=part, usage=None)
+            finally:
+                if request["model"] == "fast":
+                    closed.set()
+
+        chunks = list(router().stream(open_stream, model="fast", messages=MESSAGES))
+        self.assertEqual([(c.model, c.text) for c in chunks], [("backup", "a"), ("backup", "b")])
+        self.assertTrue(closed.wait(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import time
+import unittest
+
+from context_window import new_window_state
+from session_store import MemoryBackend, SessionStore, strip_private, trim_history
+
+
+def conversation(turns, size=300):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * size}
+        for i in range(2 * turns)
+    ]
+
+
+class TrimHistoryTest(unittest.TestCase):
+    def test_small_sessions_are_stored_as_is(self):
+        state = {"chat_history": conversation(3), "context_window": new_window_state()}
+        self.assertEqual(json.loads(trim_history(state, 1 << 20)), state)
+
+    def test_trims_a_copy_and_leaves_the_live_session_alone(self):
+        history = conversation(50)
+        window = new_window_state()
+        window["folded"] = 90
+        state = {"chat_history": history, "context_window": window}
+        stored = json.loads(trim_history(state, 4000))
+        self.assertLessEqual(len(json.dumps(stored)), 4000)
+        self.assertEqual(len(history), 100)
+        self.assertEqual(window["folded"], 90)
+        kept = len(stored["chat_history"])
+        self.assertEqual(stored["chat_history"], history[-kept:])
+        self.assertEqual(stored["context_window"]["folded"], 90 - (100 - kept))
+
+    def test_unfolded_messages_are_summarised_before_they_are_dropped(self):
+        history = conversation(10, size=200)
+        history[0]["content"] = "my email is alice@acme.com " + history[0]["content"]
+        state = {"chat_history": history, "context_window": new_window_state()}
+        stored = json.loads(trim_history(state, 2000))
+        window = stored["context_window"]
+        self.assertEqual(window["folded"], 0)
+        self.assertIn("alice@acme.com", window["contacts"])
+        self.assertTrue(window["summary"])
+
+    def test_long_sessions_save_in_linear_time(self):
+        store = SessionStore(MemoryBackend(), max_bytes=256 * 1024)
+        state = {"chat_history": conversation(1000), "context_window": new_window_state()}
+        started = time.perf_counter()
+        size = store.save("a" * 32, state)
+        self.assertLessEqual(size, 256 * 1024)
+        self.assertLess(time.perf_counter() - started, 0.2)
+        self.assertEqual(len(state["chat_history"]), 2000)
+
+
+class StripPrivateTest(unittest.TestCase):
+    def test_contact_details_are_not_restored_from_a_url_id(self):
+        window = new_window_state()
+        window["contacts"] = ["alice@acme.com", "+6591234567"]
+        window["summary"] = ["Customer: call me on +65 9123 4567"]
+        saved = {
+            "chat_history": [{"role": "user", "content": "I'm alice@acme.com"}],
+            "chat_context": [{"role": "system", "content": "The nearest store to the user is: ..."}],
+            "context_window": window,
+            "chat_enabled": True,
+        }
+        restored = strip_private(saved)
+        self.assertNotIn("chat_context", restored)
+        self.assertEqual(restored["context_window"]["contacts"], [])
+        self.assertEqual(restored["context_window"]["summary"], ["Customer: call me on [phone]"])
+        self.assertEqual(restored["chat_history"][0]["content"], "I'm [email]")
+        self.assertTrue(restored["chat_enabled"])
+        self.assertEqual(saved["context_window"]["contacts"], ["alice@acme.com", "+6591234567"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import calendar
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from log_backend import BatchWriter
+
+# Where and how often transcript segments roll over, overridable through the environment
+TRANSCRIPT_DIR = os.getenv("NITTI_TRANSCRIPT_DIR", "transcripts")
+TRANSCRIPT_MAX_BYTES = int(os.getenv("NITTI_TRANSCRIPT_MAX_BYTES", str(16 * 1024 * 1024)))
+TRANSCRIPT_MAX_AGE = float(os.getenv("NITTI_TRANSCRIPT_MAX_AGE", str(24 * 3600)))
+TRANSCRIPTS_ENABLED = os.getenv("NITTI_TRANSCRIPTS", "1") != "0"
+
+SEGMENT_PREFIX = "transcript-"
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+class SegmentSink:
+    """
+    Appends records as JSON lines to the current segment file and starts a new one
+    once it grows past `max_bytes` or gets older than `max_age` seconds. Closed
+    segments are gzip-compressed. Segment names carry the start time and the pid,
+    so several worker processes can share one directory.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_DIR, max_bytes=TRANSCRIPT_MAX_BYTES, max_age=TRANSCRIPT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.file = None
+        self.path = None
+        self.opened_at = 0.0
+        self.sequence = 0
+        # The writer thread and a caller hit by backpressure may both write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        now = time.time()
+        stamp = time.strftime(SEGMENT_TIME_FORMAT, time.gmtime(now))
+        self.sequence += 1  # keeps names unique when segments roll over within a second
+        self.path = os.path.join(
+            self.directory, f"{SEGMENT_PREFIX}{stamp}-{os.getpid()}-{self.sequence:06d}.jsonl"
+        )
+        self.file = open(self.path, mode="a", encoding="utf-8")
+        self.opened_at = now
+
+    def _rotate(self):
+        self.file.close()
+        compress_segment(self.path)
+        self.file = None
+
+    def write(self, rows):
+        with self._lock:
+            if self.file is not None and (
+                self.file.tell() >= self.max_bytes or time.time() - self.opened_at >= self.max_age
+            ):
+                self._rotate()
+            if self.file is None:
+                self._open()
+            self.file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            self.file.flush()
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self._rotate()
+
+
+def compress_segment(path):
+    """Replaces `path` with `path.gz`; the rename makes the compressed file appear atomically."""
+    with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(path + ".gz.tmp", path + ".gz")
+    os.remove(path)
+
+
+def segment_paths(directory=TRANSCRIPT_DIR):
+    """Segment files (compressed or still open) in the order they were started."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    names = [n for n in names if n.startswith(SEGMENT_PREFIX) and n.endswith((".jsonl", ".jsonl.gz"))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def segment_started(path):
+    """Start time (epoch seconds) encoded in a segment's file name."""
+    stamp = os.path.basename(path)[len(SEGMENT_PREFIX):].split("-")[0]
+    return calendar.timegm(time.strptime(stamp, SEGMENT_TIME_FORMAT))
+
+
+def iter_transcripts(directory=TRANSCRIPT_DIR, since=None, until=None):
+    """
+    Yields transcript records one at a time across every segment, so months of
+    logs can be scanned in constant memory. `since` / `until` are epoch seconds
+    compared against each record's `ts`.
+    """
+    for path in segment_paths(directory):
+        if until is not None and segment_started(path) > until:
+            break
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, mode="rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # a line cut short by a crash
+                    continue
+                ts = record.get("ts", 0)
+                if (since is None or ts >= since) and (until is None or ts <= until):
+                    yield record
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_transcript_writer():
+    """The process-wide transcript writer, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BatchWriter(SegmentSink(), spill_path=os.path.join(TRANSCRIPT_DIR, "failed.jsonl"))
+        return _writer
+
+
+def log_turn(session_id, user, assistant, **stats):
+    """Queues one exchange for the background transcript writer; never touches the disk itself."""
+    if not TRANSCRIPTS_ENABLED:
+        return
+    get_transcript_writer().put({
+        "ts": time.time(),
+        "session_id": session_id,
+        "user": user,
+        "assistant": assistant,
+        **stats,
+    })
+
+
+if __name__ == "__main__":
+    # Usage: python transcript_store.py [DIRECTORY]  -- prints every record as JSONL
+    for record in iter_transcripts(sys.argv[1] if len(sys.argv) > 1 else TRANSCRIPT_DIR):
+        print(json.dumps(record, ensure_ascii=False))